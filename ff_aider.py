@@ -1,14 +1,160 @@
 #!/usr/bin/env python3
 
-import sys, os, logging, traceback, errno, argparse, subprocess, yaml, time
-from datetime import datetime
+import sys, os, re, logging, traceback, errno, time, types, threading, contextlib
+from datetime import datetime, timedelta
 
-import requests
+# LOAD 로 자주 실행되기 때문에 시간이 걸리는 모듈(requests, yaml, argparse, subprocess, sqlite3, concurrent.futures 등)은
+# 실제로 필요한 곳에서 import
+
+'''
+Shared
+'''
+
+# LOAD 로 실행될 때마다 이 파일이 새 모듈로 로드되기 때문에
+# 실행 간에 유지해야 하는 객체(세션, 접속 확인 결과 등)는 sys.modules 에 등록된 별도 모듈에 보관
+SHARED = sys.modules.setdefault('ff_aider_shared', types.ModuleType('ff_aider_shared'))
+SHARED.__dict__.setdefault('lock', threading.RLock())
+
+def get_shared(name, factory):
+    '''name: str, factory: Callable[[], Any] -> Any'''
+    with SHARED.lock:
+        if not hasattr(SHARED, name):
+            setattr(SHARED, name, factory())
+        return getattr(SHARED, name)
+
+def yaml_load(stream):
+    '''stream: str | IO -> Any'''
+    '''libyaml 이 설치되어 있으면 C 로더로 읽음'''
+    import yaml
+    return yaml.load(stream, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
 
 '''
 Classes
 '''
 
+class Metrics:
+    '''
+    실행 단계별 소요 시간과 처리량(항목, 폴더, 바이트 수)을 집계
+
+    - 단계가 끝날 때마다 JSON 로그(DEBUG)를 남김
+    - 실행이 끝나면 요약 JSON 로그(INFO)와 node_exporter textfile collector 용 파일을 출력
+    '''
+
+    FIELDS = ('items', 'dirs', 'bytes', 'errors')
+    GAUGES = {
+        'backlog_items': '상태별 스캔 항목 수',
+        'backlog_dirs': '상태별 스캔 항목의 폴더 수',
+        'rc_concurrency_limit': 'RC 동시 요청 한도',
+    }
+
+    def __init__(self, command=None, logger=None, textfile_dir=None, log=True):
+        '''command: str = None, logger: Logger = None, textfile_dir: str = None, log: bool = True'''
+        self.command = command
+        self.logger = logger or logging.getLogger(__name__)
+        self.textfile_dir = textfile_dir
+        self.log = log
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.gauges = {}
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name, **counts):
+        '''name: str, Unpack[str, int] -> Iterator[dict[str, int]]'''
+        '''블록의 소요 시간을 name 단계로 기록, 블록 안에서 반환된 dict 에 처리량을 추가할 수 있음'''
+        started = time.perf_counter()
+        try:
+            yield counts
+        except Exception:
+            counts['errors'] = counts.get('errors', 0) + 1
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **counts)
+
+    def observe(self, name, seconds, **counts):
+        '''name: str, seconds: float, Unpack[str, int] -> None'''
+        with self.lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = {'calls': 0, 'seconds': 0.0, 'seconds_max': 0.0, **dict.fromkeys(self.FIELDS, 0)}
+            phase['calls'] += 1
+            phase['seconds'] += seconds
+            phase['seconds_max'] = max(phase['seconds_max'], seconds)
+            for field in self.FIELDS:
+                phase[field] += counts.get(field, 0)
+        if self.log and self.logger.isEnabledFor(logging.DEBUG):
+            self.emit('phase', logging.DEBUG, phase=name, seconds=round(seconds, 6), **counts)
+
+    def gauge(self, name, value, **labels):
+        '''name: str, value: float, Unpack[str, str] -> None'''
+        '''실행 시점의 값(대기 항목 수 등)을 기록'''
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def emit(self, event, level, **fields):
+        '''event: str, level: int, Unpack[str, Any] -> None'''
+        import json
+        self.logger.log(level, json.dumps({'event': event, 'command': self.command, **fields}, ensure_ascii=False))
+
+    def report(self, success=True):
+        '''success: bool = True -> None'''
+        '''실행 요약을 JSON 로그와 textfile 로 출력'''
+        duration = time.perf_counter() - self.started
+        if self.log:
+            with self.lock:
+                phases = {name: {key: round(value, 6) for key, value in phase.items()} for name, phase in self.phases.items()}
+                gauges = [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in self.gauges.items()]
+            self.emit('run', logging.INFO, success=success, seconds=round(duration, 6), phases=phases, gauges=gauges)
+        self.export(success, duration)
+
+    def export(self, success=True, duration=None):
+        '''success: bool = True, duration: float = None -> None'''
+        '''
+        textfile_dir 에 ff_aider_{명령}.prom 파일을 저장
+        node_exporter 가 쓰는 도중의 파일을 읽지 않도록 임시 파일에 쓴 뒤 교체
+        '''
+        if not self.textfile_dir:
+            return
+        if duration is None:
+            duration = time.perf_counter() - self.started
+        command = self.command or 'default'
+        def labels(**values):
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values.values())
+            return '{' + ','.join(f'{key}="{value}"' for key, value in zip(values, escaped)) + '}'
+        lines = []
+        def metric(name, help, samples):
+            lines.append(f'# HELP ff_aider_{name} {help}')
+            lines.append(f'# TYPE ff_aider_{name} gauge')
+            for sample_labels, value in samples:
+                lines.append(f'ff_aider_{name}{sample_labels} {value}')
+        run_labels = labels(command=command)
+        metric('run_timestamp_seconds', '실행이 끝난 시각', [(run_labels, f'{time.time():.3f}')])
+        metric('run_duration_seconds', '실행 시간(초)', [(run_labels, f'{duration:.6f}')])
+        metric('run_success', '실행 성공 여부', [(run_labels, int(success))])
+        with self.lock:
+            phases = sorted((name, dict(phase)) for name, phase in self.phases.items())
+            gauges = sorted(self.gauges.items())
+        descriptions = {
+            'calls': '단계 실행 횟수',
+            'seconds': '단계 소요 시간 합계(초)',
+            'seconds_max': '단계 소요 시간 최대값(초)',
+            'items': '단계에서 처리한 항목 수',
+            'dirs': '단계에서 처리한 폴더 수',
+            'bytes': '단계에서 받은 응답 크기(바이트)',
+            'errors': '단계에서 발생한 오류 수',
+        }
+        for field, help in descriptions.items():
+            metric(f'phase_{field}', help, [(labels(command=command, phase=name), phase[field]) for name, phase in phases])
+        for name in dict.fromkeys(name for (name, _), _ in gauges):
+            metric(name, self.GAUGES.get(name, name), [(labels(command=command, **dict(sample_labels)), value) for (gauge_name, sample_labels), value in gauges if gauge_name == name])
+        file = os.path.join(self.textfile_dir, f'ff_aider_{"".join(c if c.isalnum() else "_" for c in command)}.prom')
+        try:
+            with open(f'{file}.{os.getpid()}', 'w', encoding='utf-8') as stream:
+                stream.write('\n'.join(lines) + '\n')
+            os.replace(f'{file}.{os.getpid()}', file)
+        except OSError as e:
+            self.logger.warning(f'metrics 파일을 저장할 수 없어요: {e}')
+
 class AgentBase:
 
     name = None
@@ -22,15 +168,40 @@ class AgentBase:
         if self.config.log.logger is None:
             self.logger = logging.getLogger(__name__)
             self.logger.setLevel(self.config.log.level)
-            self.logger.addHandler(logging.StreamHandler())
+            # router 와 리모트별 agent 가 같은 logger 를 사용하므로 handler 는 한번만 추가
+            if not self.logger.handlers:
+                self.logger.addHandler(logging.StreamHandler())
             self.config.log.logger = self.logger
         else:
             self.logger = self.config.log.logger
-
-    def request(self, *args, **kwargs):
-        '''any -> Response | None'''
+        self.metrics = self.config.get('metrics') or Metrics(logger=self.logger)
+
+    def get_db_file(self):
+        '''None -> str'''
+        '''ff_aider.yaml 과 같은 폴더에 위치한 로컬 DB 파일 경로'''
+        base_dir = os.path.dirname(self.config.get('config_file') or os.path.abspath(__file__))
+        return os.path.join(base_dir, self.config.get('db_file') or 'ff_aider.db')
+
+    def get_session(self, key=None, pool_size=10):
+        '''key: str = None, pool_size: int = 10 -> Session'''
+        import requests
+        key = key if key else self.name
+        sessions = get_shared('sessions', dict)
+        with SHARED.lock:
+            session = sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                sessions[key] = session
+        return session
+
+    def request(self, *args, session=None, **kwargs):
+        '''any, session: Session = None -> Response | None'''
+        import requests
         try:
-            return requests.post(*args, **kwargs)
+            return (session if session else requests).post(*args, **kwargs)
         except Exception as e:
             tb = traceback.format_exc()
             self.logger.error(tb)
@@ -85,25 +256,116 @@ class AgentPluginBase(AgentBase):
         plugin_instance = self.get_plugin(plugin)
         return plugin_instance.logic.get_module(module)
 
+    @contextlib.contextmanager
+    def transaction(self):
+        '''None -> Iterator[Session]'''
+        '''블록 안의 DB 작업을 한번에 commit, 오류가 발생하면 rollback'''
+        with self.F.app.app_context():
+            session = self.F.db.session
+            try:
+                yield session
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
 class AgentPlexmate(AgentPluginBase):
 
     def __init__(self, config, framework):
         '''config: dict, framework: Framework'''
         super(AgentPlexmate, self).__init__(config, framework, name='agent.plexmate')
+        self.paths = PathMapper({}, self.config.get('rclone', {}).get('exists_ttl', 60))
+        self.active_folders = None
 
     def get_scan_items(self, status):
         '''status: str -> list[ModelScanItem]'''
         return self.get_scan_model().get_list_by_status(status)
 
-    def get_scan_targets(self, status):
-        '''status: str -> dict[str, str]'''
-        scan_items = self.get_scan_items(status)
-        targets = {}
-        for scan_item in scan_items:
-            self.logger.debug(f'대상: {scan_item.target}')
-            folder, file = os.path.split(scan_item.target)
-            targets.setdefault(folder, []).append(file)
-        return targets
+    def query_scan_items(self, session, status, started_before=None, id_range=None):
+        '''session: Session, status: str, started_before: datetime = None, id_range: tuple[int, int] = None -> Query'''
+        '''
+        status 항목 중 조건에 맞는 항목만 조회하는 쿼리
+        started_before: process_start_time 이 이 시각 이전인 항목
+        id_range: start <= id < end 인 항목
+        '''
+        model = self.get_scan_model()
+        query = session.query(model).filter(model.status == status)
+        if started_before is not None:
+            query = query.filter(model.process_start_time <= started_before)
+        if id_range is not None:
+            query = query.filter(model.id >= id_range[0], model.id < id_range[1])
+        return query
+
+    def count_scan_items(self, status, started_before=None, id_range=None):
+        '''status: str, started_before: datetime = None, id_range: tuple[int, int] = None -> int'''
+        with self.F.app.app_context():
+            return self.query_scan_items(self.F.db.session, status, started_before, id_range).count()
+
+    def find_scan_items(self, status, started_before=None, id_range=None):
+        '''status: str, started_before: datetime = None, id_range: tuple[int, int] = None -> list[ModelScanItem]'''
+        with self.F.app.app_context():
+            return self.query_scan_items(self.F.db.session, status, started_before, id_range).all()
+
+    def get_scan_targets(self, status, batch_size=1000):
+        '''status: str, batch_size: int = 1000 -> Iterator[str]'''
+        '''status 항목의 폴더를 중복 없이 하나씩 반환'''
+        for folder, _ in self.get_scan_files(status, batch_size, keep_files=False):
+            yield folder
+
+    def get_scan_files(self, status, batch_size=1000, keep_files=True):
+        '''status: str, batch_size: int = 1000, keep_files: bool = True -> Iterator[tuple[str, list[str]]]'''
+        '''
+        status 항목을 폴더별로 모아서 (폴더, [항목 경로, ...]) 를 중복 없이 하나씩 반환
+        target 순으로 정렬해서 마지막으로 받은 target 이후를 batch_size 개씩 받아오기 때문에
+        항목 수와 상관없이 메모리 사용량이 일정하고, 반환한 폴더를 처리하는 동안 DB 조회를 열어두지 않음
+        target 순으로 정렬하면 한 폴더의 파일은 그 폴더의 하위 폴더 항목 사이에만 흩어지기 때문에
+        현재 항목의 상위 폴더만 스택으로 유지하면 폴더가 끝났는지 알 수 있음
+        keep_files 가 False 이면 항목 경로를 모으지 않음
+        '''
+        model = self.get_scan_model()
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        with self.metrics.phase('get_scan_targets') as counts:
+            counts.update(items=0, dirs=0)
+            # [폴더, 항목 경로 목록]
+            stack = []
+            rows = None
+            while rows is None or len(rows) == batch_size:
+                with self.F.app.app_context():
+                    query = self.F.db.session.query(model.target).filter(model.status == status)
+                    if rows:
+                        # 같은 target 의 중복 항목은 같은 폴더라서 건너뛰어도 됨
+                        query = query.filter(model.target > rows[-1][0])
+                    rows = query.order_by(model.target).limit(batch_size).all()
+                for target, in rows:
+                    counts['items'] += 1
+                    if debug:
+                        self.logger.debug(f'대상: {target}')
+                    folder = os.path.dirname(target)
+                    while stack and not (folder == stack[-1][0] or folder.startswith(stack[-1][0].rstrip('/') + '/')):
+                        yield tuple(stack.pop())
+                    if not stack or stack[-1][0] != folder:
+                        stack.append([folder, []])
+                        counts['dirs'] += 1
+                    if keep_files:
+                        stack[-1][1].append(target)
+            while stack:
+                yield tuple(stack.pop())
+        self.metrics.gauge('backlog_items', counts['items'], status=status)
+        self.metrics.gauge('backlog_dirs', counts['dirs'], status=status)
+
+    def get_new_scan_targets(self, status, last_id, limit=500):
+        '''status: str, last_id: int, limit: int = 500 -> tuple[int, list[str]]'''
+        '''id 가 last_id 보다 큰 항목만 조회해서 (조회된 마지막 id, 폴더 목록)을 반환'''
+        model = self.get_scan_model()
+        with self.F.app.app_context():
+            rows = self.F.db.session.query(model.id, model.target) \
+                .filter(model.status == status, model.id > last_id) \
+                .order_by(model.id).limit(limit).all()
+        folders = {}
+        for id, target in rows:
+            last_id = id
+            folders.setdefault(os.path.dirname(target), None)
+        return last_id, list(folders.keys())
 
     def get_module(self, module):
         return super(AgentPlexmate, self).get_module('plex_mate', module)
@@ -113,7 +375,7 @@ class AgentPlexmate(AgentPluginBase):
         return self.get_module('scan').web_list_model
 
     def check_scanning(self, max_scan_time):
-        '''max_scan_time: int -> None'''
+        '''max_scan_time: int -> list[str]'''
         '''
         SCANNING 항목 점검.
 
@@ -138,96 +400,1665 @@ class AgentPlexmate(AgentPluginBase):
 
         주의: 계속 SCANNING 상태로 유지되는 항목은 확인 후 조치.
         '''
-        model = self.get_scan_model()
-        scans = self.get_scan_items('SCANNING')
-        if scans:
-            for scan in scans:
-                if int((datetime.now() - scan.process_start_time).total_seconds() / 60) >= max_scan_time:
-                    self.logger.warn(f'스캔 시간 {max_scan_time}분 초과: {scan.target}')
-                    self.logger.warn(f'스캔 QUEUE에서 제외: {scan.target}')
-                    model.delete_by_id(scan.id)
-                    new_item = model(scan.target)
-                    new_item.id = scan.id
-                    new_item.save()
+        started_before = datetime.now() - timedelta(minutes=max_scan_time)
+        with self.metrics.phase('check_scanning') as counts:
+            if not self.count_scan_items('SCANNING', started_before=started_before):
+                return []
+            expired = self.find_scan_items('SCANNING', started_before=started_before)
+            targets = [scan.target for scan in expired]
+            for target in targets:
+                self.logger.warn(f'스캔 시간 {max_scan_time}분 초과: {target}')
+                self.logger.warn(f'스캔 QUEUE에서 제외: {target}')
+            self.requeue_scans(expired)
+            counts['items'] = len(expired)
+        return targets
 
     def check_timeover(self, item_range):
-        '''item_range: str -> None'''
+        '''item_range: str -> list[str]'''
         '''
         FINISH_TIMEOVER 항목 점검
         ID가 item_range 범위 안에 있는 TIMEOVER 항목들을 다시 READY 로 변경
         주의: 계속 시간 초과로 뜨는 항목은 확인 후 수동으로 조치
         '''
-        overs = self.get_scan_items('FINISH_TIMEOVER')
-        if overs:
-            start_id, end_id = list(map(int, item_range.split('~')))
-            for over in overs:
-                if over.id in range(start_id, end_id):
-                    self.logger.warn(f'READY 로 상태 변경 : {over.target}')
-                    over.set_status('READY', save=True)
+        with self.metrics.phase('check_timeover') as counts:
+            # 항목이 없는 대부분의 실행에서는 범위를 확인하지 않고 끝냄
+            if not self.count_scan_items('FINISH_TIMEOVER'):
+                return []
+            id_range = tuple(map(int, item_range.split('~')))
+            if not self.count_scan_items('FINISH_TIMEOVER', id_range=id_range):
+                return []
+            overs = self.find_scan_items('FINISH_TIMEOVER', id_range=id_range)
+            targets = [over.target for over in overs]
+            for target in targets:
+                self.logger.warn(f'READY 로 상태 변경 : {target}')
+            self.reset_scans(overs, 'READY')
+            counts['items'] = len(overs)
+        return targets
+
+    def check_maintenance(self):
+        '''None -> list[str]'''
+        '''설정에 따라 SCANNING, FINISH_TIMEOVER 항목을 점검하고 다시 READY 가 된 항목의 경로를 반환'''
+        targets = self.check_scanning(self.config.plexmate.max_scan_time)
+        if hasattr(self.config.plexmate, 'timeover_range'):
+            targets += self.check_timeover(self.config.plexmate.timeover_range)
+        return targets
 
     def add_scan(self, target):
         '''target: str -> ModelScanItem'''
-        scan_item = self.get_scan_model()(target)
-        scan_item.save()
+        with self.metrics.phase('add_scan', items=1):
+            scan_item = self.get_scan_model()(target)
+            scan_item.save()
         self.logger.debug(f'added scan id: {scan_item.id}')
         return scan_item
 
+    def add_scans(self, targets):
+        '''targets: Iterable[str] -> list[ModelScanItem]'''
+        '''
+        여러 스캔 항목을 하나의 트랜잭션으로 등록
+        plan_scans 에 따라 같은 폴더의 파일은 합치고 이미 대기/진행중인 폴더는 등록하지 않음
+        '''
+        targets, skipped = self.plan_scans(targets)
+        if skipped:
+            self.logger.info(f'이미 대기/진행중인 폴더에 포함되어 스캔 {len(skipped)}개 생략')
+            self.logger.debug(f'생략: {skipped}')
+            self.metrics.observe('scan_skipped', 0, items=len(skipped))
+        model = self.get_scan_model()
+        scan_items = [model(target) for target in targets]
+        if scan_items:
+            with self.metrics.phase('add_scan', items=len(scan_items)), self.transaction() as session:
+                session.add_all(scan_items)
+                session.flush()
+                self.logger.debug(f'added scan ids: {[scan_item.id for scan_item in scan_items]}')
+        return scan_items
+
+    # 확장자만으로 파일이라고 판단하는 미디어/자막 파일
+    MEDIA_EXTENSIONS = frozenset((
+        '.mkv', '.mp4', '.m4v', '.avi', '.ts', '.m2ts', '.mpg', '.mpeg', '.wmv', '.mov', '.flv', '.webm', '.iso',
+        '.srt', '.smi', '.ass', '.ssa', '.sub', '.idx', '.vtt', '.sup',
+        '.mp3', '.flac', '.m4a', '.aac', '.ogg', '.wav', '.ape', '.dsf',
+    ))
+
+    def is_media_file(self, path):
+        '''path: str -> bool'''
+        return os.path.splitext(path)[1].lower() in self.MEDIA_EXTENSIONS
+
+    def scan_folder(self, target):
+        '''target: str -> str'''
+        '''
+        plex_mate 가 스캔하는 폴더 (파일이면 상위 폴더)
+        미디어 확장자이거나 마운트에서 파일로 확인된 경우만 파일로 판단하고 그밖에는 target 자신을 폴더로 간주
+        (Avengers.Endgame.2019 처럼 점이 있는 폴더를 파일로 오인하지 않도록)
+        '''
+        target = PathTrie.join(PathTrie.split(target))
+        if self.is_media_file(target):
+            return os.path.dirname(target)
+        if not self.paths.is_dir(target) and os.path.isfile(target):
+            return os.path.dirname(target)
+        return target
+
+    def get_active_folders(self):
+        '''None -> set[str]'''
+        '''
+        대기/진행중(active_status)인 항목이 덮는 경로
+            - 항목 경로 자신 (폴더라면 하위 경로를 덮고, 파일이라면 하위 경로가 없으므로 다른 대상을 덮지 않음)
+            - 미디어 확장자인 항목의 상위 폴더 (plex_mate 는 파일이 있는 폴더를 스캔)
+        마운트를 확인하지 않고 target 순으로 scan_batch_size 개씩 받아온 경로만으로 만듦
+        실행마다 한번만 조회하고 이후에는 이번 실행에서 등록한 폴더를 추가
+        '''
+        if self.active_folders is None:
+            model = self.get_scan_model()
+            statuses = self.config.plexmate.get('active_status', ['READY', 'SCANNING'])
+            batch_size = self.config.plexmate.get('scan_batch_size', 1000)
+            active = set()
+            with self.metrics.phase('active_index') as counts, self.F.app.app_context():
+                counts['items'] = 0
+                query = self.F.db.session.query(model.target).filter(model.status.in_(statuses)).order_by(model.target)
+                for target, in query.yield_per(batch_size):
+                    counts['items'] += 1
+                    target = PathTrie.join(PathTrie.split(target))
+                    active.add(target)
+                    if self.is_media_file(target):
+                        active.add(os.path.dirname(target))
+                counts['dirs'] = len(active)
+            self.active_folders = active
+        return self.active_folders
+
+    def plan_scans(self, targets):
+        '''targets: Iterable[str] -> tuple[list[str], list[str]]'''
+        '''
+        (등록할 대상, 생략할 대상)
+        - 같은 폴더의 파일이 coalesce_files 개 이상이면 폴더 하나로 합침 (0: 합치지 않음)
+        - 스캔 폴더나 상위 폴더가 이미 대기/진행중인 항목에 덮이면 생략 (skip_queued, get_active_folders 참고)
+        - 이번에 등록할 대상끼리도 같은 폴더나 하위 폴더는 생략
+        파일로 판단되지 않은 대상은 상위 폴더로 합치지 않음
+        '''
+        threshold = self.config.plexmate.get('coalesce_files', 2)
+        active = self.get_active_folders() if self.config.plexmate.get('skip_queued', True) else set()
+        planned = []
+        files = {}
+        for target in dict.fromkeys(targets):
+            folder = self.scan_folder(target)
+            if folder == PathTrie.join(PathTrie.split(target)):
+                planned.append((folder, target))
+            else:
+                files.setdefault(folder, []).append(target)
+        for folder, folder_files in files.items():
+            if threshold and len(folder_files) >= threshold:
+                self.logger.debug(f'파일 {len(folder_files)}개를 폴더로 합침: {folder}')
+                planned.append((folder, folder))
+            else:
+                planned.extend((folder, file) for file in folder_files)
+        # 상위 폴더를 먼저 등록해야 하위 폴더가 생략됨
+        planned.sort(key=lambda item: len(PathTrie.split(item[0])))
+        accepted, skipped = [], []
+        batch = set()
+        for folder, target in planned:
+            parts = PathTrie.split(folder)
+            ancestors = [PathTrie.join(parts[:depth]) for depth in range(1, len(parts) + 1)]
+            if any(ancestor in active or ancestor in batch for ancestor in ancestors):
+                skipped.append(target)
+                continue
+            accepted.append(target)
+            batch.add(folder)
+        if self.active_folders is not None:
+            self.active_folders.update(batch)
+        return accepted, skipped
+
+    def requeue_scans(self, scans):
+        '''scans: list[ModelScanItem] -> None'''
+        '''
+        check_scanning 의 편법을 하나의 트랜잭션으로 처리
+        기존 항목들을 삭제하고 동일한 id 로 새로운 항목들을 생성
+        '''
+        if not scans:
+            return
+        model = self.get_scan_model()
+        with self.transaction() as session:
+            session.query(model).filter(model.id.in_([scan.id for scan in scans])).delete(synchronize_session=False)
+            session.flush()
+            for scan in scans:
+                new_item = model(scan.target)
+                new_item.id = scan.id
+                session.add(new_item)
+
+    def reset_scans(self, scans, status):
+        '''scans: list[ModelScanItem], status: str -> None'''
+        '''여러 항목의 상태를 하나의 트랜잭션으로 변경'''
+        if not scans:
+            return
+        with self.transaction() as session:
+            for scan in scans:
+                session.add(scan)
+                scan.set_status(status, save=False)
+
+class LocalStore:
+
+    '''
+    ff_aider 가 실행 간에 유지하는 정보를 저장하는 sqlite DB
+    하나의 연결을 여러 스레드가 lock 으로 공유
+    '''
+
+    schema = ''
+
+    def __init__(self, path):
+        '''path: str'''
+        import sqlite3
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.executescript(self.schema)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        '''None -> Iterator[Connection]'''
+        with self.lock, self.connection:
+            yield self.connection
+
+    def execute(self, sql, parameters=()):
+        '''sql: str, parameters: Sequence = () -> list[tuple]'''
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def executemany(self, sql, seq_of_parameters):
+        '''sql: str, seq_of_parameters: Iterable[Sequence] -> None'''
+        with self.lock, self.connection:
+            self.connection.executemany(sql, seq_of_parameters)
+
+    def close(self):
+        '''None -> None'''
+        with self.lock:
+            self.connection.close()
+
+class RefreshCache(LocalStore):
+
+    '''
+    최근에 vfs/refresh 된 리모트 경로와 시각
+    ttl 이내에 새로고침된 경로, 혹은 ttl 이내에 recursive 로 새로고침된 상위 경로가 있으면 새로고침을 생략
+    namespace 는 리모트(rclone.endpoints)별로 같은 경로를 구분하기 위해 경로 앞에 붙임
+    '''
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS refresh_cache (
+            path TEXT PRIMARY KEY,
+            refreshed REAL NOT NULL,
+            recursive INTEGER NOT NULL
+        );
+    '''
+
+    def __init__(self, path, ttl, namespace=''):
+        '''path: str, ttl: int, namespace: str = '' '''
+        super(RefreshCache, self).__init__(path)
+        self.ttl = ttl
+        self.namespace = namespace
+        self.execute('DELETE FROM refresh_cache WHERE refreshed < ?', (time.time() - ttl,))
+
+    def is_fresh(self, path, recursive=False):
+        '''path: str, recursive: bool = False -> bool'''
+        parts = PathTrie.split(path)
+        ancestors = [self.namespace + PathTrie.join(parts[:depth]) for depth in range(1, len(parts))]
+        path = self.namespace + PathTrie.join(parts)
+        rows = self.execute(
+            f'SELECT path, recursive FROM refresh_cache WHERE refreshed >= ? AND path IN ({",".join("?" * (len(ancestors) + 1))})',
+            (time.time() - self.ttl, path, *ancestors)
+        )
+        for cached_path, cached_recursive in rows:
+            if cached_recursive or (cached_path == path and not recursive):
+                return True
+        return False
+
+    def mark(self, paths, recursive=False):
+        '''paths: Iterable[str], recursive: bool = False -> None'''
+        now = time.time()
+        self.executemany(
+            'INSERT OR REPLACE INTO refresh_cache (path, refreshed, recursive) VALUES (?, ?, ?)',
+            ((self.namespace + PathTrie.join(PathTrie.split(path)), now, int(recursive)) for path in paths)
+        )
+
+class YamlCache(LocalStore):
+
+    '''
+    yaml 파일을 읽은 결과를 파일 경로, 수정 시각, 크기와 함께 저장
+    파일이 바뀌지 않았으면 다시 읽지 않고 저장된 결과를 사용
+    새로 읽은 결과는 flush() 혹은 close() 할 때 한번에 저장
+    '''
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS yaml_cache (
+            path TEXT PRIMARY KEY,
+            mtime INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            content BLOB NOT NULL
+        );
+    '''
+
+    def __init__(self, path):
+        '''path: str'''
+        super(YamlCache, self).__init__(path)
+        self.entries = {row[0]: row[1:] for row in self.execute('SELECT path, mtime, size, content FROM yaml_cache')}
+        self.pending = []
+
+    def load(self, path):
+        '''path: str -> Any'''
+        import pickle
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return pickle.loads(entry[2])
+        with open(path, 'r') as stream:
+            content = yaml_load(stream)
+        self.pending.append((path, stat.st_mtime_ns, stat.st_size, pickle.dumps(content)))
+        return content
+
+    def flush(self):
+        '''None -> None'''
+        if self.pending:
+            self.executemany('INSERT OR REPLACE INTO yaml_cache (path, mtime, size, content) VALUES (?, ?, ?, ?)', self.pending)
+            self.pending = []
+
+    def close(self):
+        '''None -> None'''
+        self.flush()
+        super(YamlCache, self).close()
+
+class DirectoryIndex(LocalStore):
+
+    '''
+    새로고침 기준 폴더(root) 아래에 있는 폴더들의 상태 (폴더 수정 시각과 바로 아래 파일 목록의 요약)
+    이전 실행의 색인과 비교해서 변경된 폴더만 새로고침할 때 사용
+    폴더 수정 시각만 저장하던 이전 색인(directory_index)은 비교할 수 없으므로 삭제
+    '''
+
+    schema = '''
+        DROP TABLE IF EXISTS directory_index;
+        CREATE TABLE IF NOT EXISTS directory_state (
+            root TEXT NOT NULL,
+            path TEXT NOT NULL,
+            state TEXT,
+            PRIMARY KEY (root, path)
+        );
+    '''
+
+    def load(self, root):
+        '''root: str -> dict[str, str]'''
+        return dict(self.execute('SELECT path, state FROM directory_state WHERE root = ?', (root,)))
+
+    def replace(self, root, dirs):
+        '''root: str, dirs: dict[str, str] -> None'''
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM directory_state WHERE root = ?', (root,))
+            connection.executemany(
+                'INSERT INTO directory_state (root, path, state) VALUES (?, ?, ?)',
+                ((root, path, state) for path, state in dirs.items())
+            )
+
+    def count_children(self, namespace, path):
+        '''namespace: str, path: str -> int'''
+        '''namespace 리모트의 색인에 있는 path 바로 아래 폴더 수 (색인에 없으면 0)'''
+        root = f'{namespace}/'
+        prefix = path.rstrip('/') + '/'
+        return self.execute(
+            'SELECT COUNT(DISTINCT path) FROM directory_state'
+            ' WHERE substr(root, 1, ?) = ? AND substr(path, 1, ?) = ? AND length(path) > ? AND instr(substr(path, ?), \'/\') = 0',
+            (len(root), root, len(prefix), prefix, len(prefix), len(prefix) + 1)
+        )[0][0]
+
+class RunJournal(LocalStore):
+
+    '''
+    plexmate 명령의 실행 기록
+    실행(key)별로 계획한 로컬 폴더와 단계(새로고침, 스캔 등록)별 완료 여부를 완료되는 즉시 저장
+    실행 도중에 종료되면 다음 실행에서 끝나지 않은 실행을 이어받아 완료된 단계를 생략함
+    같은 key 로 max_age 초 동안 이어받지 않은 실행은 버림
+    '''
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS journal_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL,
+            started REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS journal_runs_key ON journal_runs (key);
+        CREATE TABLE IF NOT EXISTS journal_dirs (
+            run INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            refreshed INTEGER NOT NULL DEFAULT 0,
+            scanned INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (run, path)
+        );
+    '''
+
+    STEPS = ('refreshed', 'scanned')
+
+    def __init__(self, path, key, max_age=86400):
+        '''path: str, key: str, max_age: int = 86400'''
+        super(RunJournal, self).__init__(path)
+        self.key = key
+        self.run = None
+        with self.transaction() as connection:
+            expired = [row[0] for row in connection.execute('SELECT id FROM journal_runs WHERE key = ? AND updated < ?', (key, time.time() - max_age))]
+            connection.executemany('DELETE FROM journal_dirs WHERE run = ?', ((run,) for run in expired))
+            connection.executemany('DELETE FROM journal_runs WHERE id = ?', ((run,) for run in expired))
+
+    def begin(self, dirs):
+        '''dirs: Iterable[str] -> bool'''
+        '''실행을 시작하고 이어받은 실행이면 True, 이어받은 실행에 없는 폴더는 계획에 추가'''
+        now = time.time()
+        with self.transaction() as connection:
+            row = connection.execute('SELECT id FROM journal_runs WHERE key = ? ORDER BY id DESC LIMIT 1', (self.key,)).fetchone()
+            resumed = row is not None
+            if resumed:
+                self.run = row[0]
+                connection.execute('UPDATE journal_runs SET updated = ? WHERE id = ?', (now, self.run))
+            else:
+                self.run = connection.execute('INSERT INTO journal_runs (key, started, updated) VALUES (?, ?, ?)', (self.key, now, now)).lastrowid
+            seq = connection.execute('SELECT COALESCE(MAX(seq), 0) FROM journal_dirs WHERE run = ?', (self.run,)).fetchone()[0]
+            connection.executemany(
+                'INSERT OR IGNORE INTO journal_dirs (run, path, seq) VALUES (?, ?, ?)',
+                ((self.run, dir, seq + index) for index, dir in enumerate(dict.fromkeys(dirs), start=1))
+            )
+        return resumed
+
+    def pending(self, step, dirs=None):
+        '''step: str, dirs: Iterable[str] = None -> list[str]'''
+        '''
+        step 단계가 끝나지 않은 폴더를 계획한 순서대로 반환
+        dirs 가 있으면 전체 계획을 읽지 않고 dirs 중에서 끝나지 않은 폴더만 dirs 의 순서대로 반환
+        '''
+        if step not in self.STEPS:
+            raise ValueError(f'알 수 없는 단계: {step}')
+        if dirs is not None:
+            return [dir for dir in dirs if self.execute(f'SELECT 1 FROM journal_dirs WHERE run = ? AND path = ? AND {step} = 0', (self.run, dir))]
+        return [row[0] for row in self.execute(f'SELECT path FROM journal_dirs WHERE run = ? AND {step} = 0 ORDER BY seq', (self.run,))]
+
+    def mark(self, step, dirs):
+        '''step: str, dirs: Iterable[str] -> None'''
+        if step not in self.STEPS:
+            raise ValueError(f'알 수 없는 단계: {step}')
+        with self.transaction() as connection:
+            connection.executemany(f'UPDATE journal_dirs SET {step} = 1 WHERE run = ? AND path = ?', ((self.run, dir) for dir in dirs))
+            connection.execute('UPDATE journal_runs SET updated = ? WHERE id = ?', (time.time(), self.run))
+
+    def finish(self):
+        '''None -> None'''
+        '''실행이 끝나면 기록을 삭제'''
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM journal_dirs WHERE run = ?', (self.run,))
+            connection.execute('DELETE FROM journal_runs WHERE id = ?', (self.run,))
+
+class SingleFlight:
+
+    '''
+    겹쳐서 실행된 plexmate 명령 중 하나(leader)만 새로고침과 스캔 점검을 하도록 조율
+        - {path}.lock 파일을 flock 으로 잠근 실행이 leader
+        - 잠그지 못한 실행(follower)은 새로고침할 폴더를 {path}.spool 폴더에 요청 파일로 남기고 결과 파일을 기다림
+        - leader 는 자신의 작업을 하는 동안에도 poll_interval 마다 쌓인 요청을 모아서 새로고침하고 요청별 결과 파일을 남김
+          작업이 끝나면 남은 요청을 모두 처리한 뒤 잠금을 풂
+        - 기다리는 동안 잠금을 얻으면(leader 가 결과 없이 종료) 요청을 거두고 직접 실행
+    flock 은 열린 파일마다 잠기기 때문에 LOAD 로 같은 프로세스에서 실행되는 명령끼리도 동작함
+    '''
+
+    def __init__(self, path, logger, timeout=3600, poll_interval=0.5):
+        '''path: str, logger: Logger, timeout: int = 3600, poll_interval: float = 0.5'''
+        self.lock_file = f'{path}.lock'
+        self.spool = f'{path}.spool'
+        self.logger = logger
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stream = None
+        os.makedirs(self.spool, exist_ok=True)
+
+    def acquire(self):
+        '''None -> bool'''
+        import fcntl
+        if self.stream is not None:
+            return True
+        stream = open(self.lock_file, 'a')
+        try:
+            fcntl.flock(stream, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            stream.close()
+            return False
+        self.stream = stream
+        return True
+
+    def release(self):
+        '''None -> None'''
+        if self.stream is not None:
+            import fcntl
+            fcntl.flock(self.stream, fcntl.LOCK_UN)
+            self.stream.close()
+            self.stream = None
+
+    def write(self, name, content):
+        '''name: str, content: dict -> None'''
+        import json
+        path = os.path.join(self.spool, name)
+        with open(f'{path}.tmp', 'w') as stream:
+            json.dump(content, stream)
+        os.replace(f'{path}.tmp', path)
+
+    def submit(self, dirs, incremental=False, force=False, reply=True):
+        '''dirs: list[str], incremental: bool = False, force: bool = False, reply: bool = True -> str'''
+        '''reply 가 False 이면 결과를 기다리지 않는 요청이라 leader 가 결과 파일을 남기지 않음'''
+        import uuid
+        request_id = uuid.uuid4().hex
+        self.write(f'{request_id}.request', {'dirs': list(dirs), 'incremental': incremental, 'force': force, 'reply': reply})
+        return request_id
+
+    def wait(self, request_id):
+        '''request_id: str -> dict | None'''
+        '''
+        leader 의 결과 {'failed': [...]} 를 반환
+        기다리는 동안 leader 가 되면 요청을 거두고 None 을 반환
+        '''
+        import json
+        response = os.path.join(self.spool, f'{request_id}.response')
+        request = os.path.join(self.spool, f'{request_id}.request')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if os.path.exists(response):
+                with open(response, 'r') as stream:
+                    result = json.load(stream)
+                os.remove(response)
+                return result
+            if self.acquire():
+                # 잠금을 얻은 사이에 결과가 생겼을 수도 있음
+                if os.path.exists(response):
+                    self.release()
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(request)
+                return None
+            if time.monotonic() > deadline:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(request)
+                raise TimeoutError(f'leader 의 결과를 기다리는 시간 초과: {request_id}')
+            time.sleep(self.poll_interval)
+
+    def requests(self):
+        '''None -> list[tuple[str, dict]]'''
+        '''쌓인 요청을 가져오고, 기다리는 실행이 없는 오래된 요청/결과 파일은 삭제'''
+        import json
+        requests = []
+        expired = time.time() - self.timeout
+        for entry in os.scandir(self.spool):
+            request_id, _, kind = entry.name.partition('.')
+            try:
+                if entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+                elif kind == 'request':
+                    with open(entry.path, 'r') as stream:
+                        request = json.load(stream)
+                    os.remove(entry.path)
+                    requests.append((request_id, request))
+            except (OSError, ValueError):
+                self.logger.warning(f'요청 파일을 읽을 수 없어요: {entry.path}')
+        return requests
+
+    def respond(self, request_id, result):
+        '''request_id: str, result: dict -> None'''
+        self.write(f'{request_id}.response', result)
+
+class PathTrie:
+
+    class Node:
+
+        __slots__ = ('children', 'terminal')
+
+        def __init__(self):
+            '''None'''
+            self.children = {}
+            self.terminal = False
+
+    def __init__(self, paths=()):
+        '''paths: Iterable[str] = ()'''
+        self.root = PathTrie.Node()
+        for path in paths:
+            self.insert(path)
+
+    @staticmethod
+    def split(path):
+        '''path: str -> tuple[str]'''
+        parts = os.path.normpath(path).split('/')
+        return tuple(parts[:1] + [part for part in parts[1:] if part])
+
+    @staticmethod
+    def join(parts):
+        '''parts: tuple[str] -> str'''
+        return '/'.join(parts) or '/'
+
+    def insert(self, path):
+        '''path: str -> None'''
+        node = self.root
+        for part in self.split(path):
+            node = node.children.setdefault(part, PathTrie.Node())
+        node.terminal = True
+
+    def collapse(self, merge_siblings=0, children=None, coverage=0.9):
+        '''merge_siblings: int = 0, children: Callable[[tuple[str]], int | None] = None, coverage: float = 0.9 -> list[tuple[str]]'''
+        '''
+        상위 경로가 포함되어 있으면 하위 경로는 제외
+        merge_siblings 이상의 하위 폴더가 같은 부모를 가지고 부모의 전체 하위 폴더 중 coverage 비율 이상이면 부모 폴더 하나로 병합
+        children 은 부모 경로의 전체 하위 폴더 수를 반환하고, 없거나 알 수 없으면(None) 요청한 하위 폴더 수로 판단 (merge_siblings 0: 병합 안 함)
+        '''
+        def walk(node, parts):
+            if node.terminal:
+                return [parts]
+            plans = []
+            for name, child in node.children.items():
+                plans.extend(walk(child, parts + (name,)))
+            if merge_siblings and len(parts) > 1 and len(plans) >= merge_siblings \
+                    and all(len(plan) == len(parts) + 1 for plan in plans):
+                # 요청하지 않은 형제 폴더가 많으면 부모 폴더를 recursive 로 새로고침하는 비용이 더 큼
+                total = children(parts) if children else None
+                if len(plans) >= (len(node.children) if total is None else total) * coverage:
+                    return [parts]
+            return plans
+        return walk(self.root, ())
+
+class PathMapper:
+
+    '''
+    rc_mapping 규칙을 경로 구성요소 단위의 트리로 만들어서 가장 긴 접두 경로 하나만 변환
+    폴더의 존재 여부 확인 결과는 ttl 동안 다시 확인하지 않음
+    '''
+
+    def __init__(self, mapping, ttl=60):
+        '''mapping: dict[str, str], ttl: int = 60'''
+        self.root = {}
+        for source, target in (mapping or {}).items():
+            node = self.root
+            for part in PathTrie.split(source):
+                node = node.setdefault(part, {})
+            node[None] = target
+        self.ttl = ttl
+        self.existing = get_shared('existing_paths', dict)
+        self.missing = {}
+
+    def is_dir(self, path):
+        '''path: str -> bool'''
+        now = time.monotonic()
+        checked_at = self.existing.get(path)
+        if checked_at is not None and now - checked_at < self.ttl:
+            return True
+        checked_at = self.missing.get(path)
+        if checked_at is not None and now - checked_at < self.ttl:
+            return False
+        if len(self.existing) + len(self.missing) > 10000:
+            self.prune(now)
+        if os.path.isdir(path):
+            self.existing[path] = now
+            self.missing.pop(path, None)
+            return True
+        self.existing.pop(path, None)
+        self.missing[path] = now
+        return False
+
+    def prune(self, now):
+        '''now: float -> None'''
+        '''오래 실행되는 감시 작업에서 확인 결과가 계속 쌓이지 않도록 ttl 이 지난 결과를 정리'''
+        for checked in (self.existing, self.missing):
+            for path in [path for path, checked_at in checked.items() if now - checked_at >= self.ttl]:
+                checked.pop(path, None)
+
+    def find_existing(self, path):
+        '''path: str -> str | None'''
+        '''path 가 파일이거나 존재하지 않으면 존재하는 상위 폴더를 반환'''
+        while not self.is_dir(path):
+            head, tail = os.path.split(path)
+            if tail == '':
+                return None
+            path = head
+        return path
+
+    def lookup(self, path):
+        '''path: str -> tuple[str, int] | None'''
+        '''가장 길게 일치하는 규칙의 (변경할 경로, 일치한 경로 구성요소 수)'''
+        parts = PathTrie.split(path)
+        node = self.root
+        matched = None
+        for depth, part in enumerate(parts):
+            if None in node:
+                matched = (node[None], depth)
+            node = node.get(part)
+            if node is None:
+                break
+        else:
+            if None in node:
+                matched = (node[None], len(parts))
+        return matched
+
+    def map(self, path):
+        '''path: str -> str'''
+        matched = self.lookup(path)
+        if matched is None:
+            return os.path.normpath(path)
+        target, depth = matched
+        return os.path.normpath(target + '/' + '/'.join(PathTrie.split(path)[depth:]))
+
+class RateGovernor:
+    '''
+    rclone RC 요청의 동시 실행 수를 AIMD 방식으로 조절
+
+    - 성공하고 응답 시간이 기준 이내: 동시 실행 수를 한 바퀴(limit 개의 요청)에 1 씩 늘림
+      마지막으로 제한에 걸린 값 근처에서는 천천히 늘림
+    - 429/503 응답, 사용량 제한 오류: backoff 배로 줄이고 새 요청을 멈춤
+      rclone RC 는 일반 오류(job not found 등)도 500 으로 응답하기 때문에 그 외의 응답은 본문으로 확인
+      멈추는 시간은 Retry-After 가 있으면 그 값, 없으면 cooldown 에서 시작해서 연속으로 걸릴 때마다 두 배
+    - 응답 시간이 기준의 latency_factor 배를 넘음: backoff 배로 줄임
+      응답 시간은 최근 요청 위주의 이동 평균, 기준은 오래 유지되는 느린 이동 평균이라
+      평소의 응답 시간 편차로는 줄이지 않고 혼잡으로 응답 시간이 계속 늘어날 때만 줄임
+    - 이미 minimum 이면 줄이지 않음 (사용량 제한의 대기는 유지)
+
+    같은 RC 주소를 사용하는 모든 요청이 하나의 governor 를 공유 (LOAD 로 동시에 실행되는 다른 명령 포함)
+    '''
+
+    THROTTLED = re.compile(r'rate ?limit|quota ?exceeded|too many requests|Error 403|Error 429', re.IGNORECASE)
+
+    def __init__(self, initial, logger):
+        '''initial: int, logger: Logger'''
+        self.condition = threading.Condition()
+        self.logger = logger
+        self.limit = float(initial)
+        self.minimum = 1
+        self.maximum = 16
+        self.backoff = 0.5
+        self.cooldown = 1
+        self.latency_factor = 3.0
+        self.in_flight = 0
+        self.paused_until = 0
+        self.decreased_at = 0
+        self.ceiling = None
+        self.strikes = 0
+        self.baseline = None
+        self.latency = None
+
+    def configure(self, minimum=1, maximum=16, backoff=0.5, cooldown=1, latency_factor=3.0):
+        '''minimum: int = 1, maximum: int = 16, backoff: float = 0.5, cooldown: float = 1, latency_factor: float = 3.0 -> RateGovernor'''
+        with self.condition:
+            self.minimum = max(1, minimum)
+            self.maximum = max(self.minimum, maximum)
+            self.backoff = backoff
+            self.cooldown = cooldown
+            self.latency_factor = latency_factor
+            self.limit = min(max(self.limit, self.minimum), self.maximum)
+            self.condition.notify_all()
+        return self
+
+    @contextlib.contextmanager
+    def slot(self):
+        '''None -> Iterator[None]'''
+        '''동시 실행 수가 limit 보다 작고 대기 시간이 지나면 진입'''
+        with self.condition:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause <= 0 and self.in_flight < int(self.limit):
+                    break
+                self.condition.wait(pause if pause > 0 else None)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def is_throttled(self, status_code, text=None):
+        '''status_code: int, text: str = None -> bool'''
+        return status_code in (429, 503) or bool(text and self.THROTTLED.search(text))
+
+    def record(self, latency=None, throttled=False, retry_after=None):
+        '''latency: float = None, throttled: bool = False, retry_after: float = None -> None'''
+        '''
+        요청 결과를 반영
+        latency: 기준 단위(vfs/refresh 는 폴더 하나)당 응답 시간(초)
+        '''
+        with self.condition:
+            if throttled:
+                self.decrease('사용량 제한', retry_after if retry_after is not None else min(self.cooldown * 2 ** self.strikes, 60), throttled=True)
+                return
+            if latency is None:
+                return
+            self.latency = latency if self.latency is None else self.latency * 0.8 + latency * 0.2
+            # 튀는 값이 기준을 끌어올리지 않도록 기준의 latency_factor 배까지만 반영
+            self.baseline = latency if self.baseline is None else self.baseline * 0.98 + min(latency, self.baseline * self.latency_factor) * 0.02
+            if self.latency > self.baseline * self.latency_factor:
+                self.decrease('응답 지연', 0)
+                return
+            self.strikes = 0
+            previous = self.limit
+            step = 1 / self.limit
+            if self.ceiling is not None and self.limit + 1 >= self.ceiling:
+                step /= 4
+            self.limit = min(self.maximum, self.limit + step)
+            if int(self.limit) != int(previous):
+                self.logger.debug(f'RC 동시 요청 증가: {int(previous)} -> {int(self.limit)} ({self.describe()})')
+                self.condition.notify_all()
+
+    def decrease(self, reason, pause, throttled=False):
+        '''reason: str, pause: float, throttled: bool = False -> None'''
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + pause)
+        # 같은 혼잡으로 여러 요청이 한꺼번에 실패해도 한 번만 줄임
+        if now - self.decreased_at < max(pause, 1):
+            return
+        self.decreased_at = now
+        self.latency = None
+        if throttled:
+            self.strikes += 1
+        if self.limit <= self.minimum:
+            return
+        previous = self.limit
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        if throttled:
+            self.ceiling = previous
+        self.logger.warning(f'RC 동시 요청 감소: {previous:.1f} -> {self.limit:.1f}, 사유: {reason}, 대기: {pause}초 ({self.describe()})')
+
+    def describe(self):
+        '''None -> str'''
+        latency = f'{self.latency * 1000:.1f}ms' if self.latency is not None else '-'
+        baseline = f'{self.baseline * 1000:.1f}ms' if self.baseline is not None else '-'
+        return f'한도: {self.limit:.1f}/{self.maximum}, 진행중: {self.in_flight}, 응답: {latency}, 기준: {baseline}'
+
 class AgentRclone(AgentBase):
 
     connectible = False
 
-    def __init__(self, config):
-        '''config: dict'''
-        super(AgentRclone, self).__init__(config, name='agent.rclone')
+    def __init__(self, config, endpoint=None):
+        '''config: dict, endpoint: str = None'''
+        '''endpoint 가 있으면 rclone.endpoints 의 해당 리모트 설정으로 동작'''
+        if endpoint is not None:
+            config = self.endpoint_config(config, endpoint)
+        super(AgentRclone, self).__init__(config, name=f'agent.rclone.{endpoint}' if endpoint else 'agent.rclone')
+        self.endpoint = endpoint
+        # 로컬 DB 에 저장하는 리모트 경로를 리모트별로 구분 (기본 리모트는 기존 경로 그대로)
+        self.namespace = f'{endpoint}:' if endpoint else ''
+        self.session = self.get_session(f'rclone:{self.config.rclone.rc_addr}', self.config.rclone.get('pool_size', 10))
+        self.session.auth = (self.config.rclone.get('rc_user', ''), self.config.rclone.get('rc_pass', ''))
+        self.timeout = (self.config.rclone.get('timeout_connect', 5), self.config.rclone.get('timeout_read', 300))
+        self.mapper = PathMapper(self.config.rclone.rc_mapping, self.config.rclone.get('exists_ttl', 60))
+        refresh_ttl = self.config.rclone.get('refresh_ttl', 0)
+        self.refresh_cache = RefreshCache(self.get_db_file(), refresh_ttl, self.namespace) if refresh_ttl else None
+        self.governor = self.get_governor()
         self.connectible = self.check_connection()
 
+    @staticmethod
+    def endpoint_config(config, endpoint):
+        '''config: dict, endpoint: str -> dict'''
+        '''
+        rclone.endpoints 의 리모트 설정
+        rc_mapping, fs 를 제외한 rclone 설정은 리모트에 없으면 기본 리모트의 값을 사용
+        '''
+        rclone = {key: value for key, value in config['rclone'].items() if key not in ('endpoints', 'rc_mapping', 'fs')}
+        rclone.update(config['rclone']['endpoints'][endpoint])
+        config = dict(config)
+        config['rclone'] = rclone
+        return config
+
+    def get_governor(self):
+        '''None -> RateGovernor | None'''
+        '''RC 주소별로 프로세스 안에서 공유하는 RateGovernor'''
+        settings = self.config.rclone.get('governor', {})
+        if not settings.get('enabled', True):
+            return None
+        governors = get_shared('rc_governors', dict)
+        with SHARED.lock:
+            governor = governors.get(self.config.rclone.rc_addr)
+            if governor is None:
+                governor = governors[self.config.rclone.rc_addr] = RateGovernor(self.config.rclone.get('refresh_concurrency', 4), self.logger)
+        return governor.configure(
+            settings.get('min_concurrency', 1),
+            settings.get('max_concurrency', 16),
+            settings.get('backoff', 0.5),
+            settings.get('cooldown', 1),
+            settings.get('latency_factor', 3.0)
+        )
+
+    def governor_slot(self):
+        '''None -> ContextManager'''
+        return self.governor.slot() if self.governor else contextlib.nullcontext()
+
     def check_connection(self):
         '''None -> bool'''
-        response = self.command('core/version')
+        probes = get_shared('rclone_probes', dict)
+        ttl = self.config.rclone.get('check_ttl', 60)
+        checked_at = probes.get(self.config.rclone.rc_addr)
+        if checked_at is not None and time.monotonic() - checked_at < ttl:
+            return True
+        with self.metrics.phase('rclone_probe'):
+            response = self.command('core/version')
         if int(str(response.status_code)[0]) == 2:
+            probes[self.config.rclone.rc_addr] = time.monotonic()
             return True
         else:
+            probes.pop(self.config.rclone.rc_addr, None)
             msg = f'접속 불가 CODE: {response.status_code}, 내용: {response.text}'
             self.logger.error(msg)
             return False
 
-    def command(self, command, data=None):
-        '''command: str, data: dict = None -> Response'''
-        return self.request(
+    def command(self, command, data=None, **kwargs):
+        '''command: str, data: dict = None, Unpack[Any, Any] -> Response'''
+        started = time.perf_counter()
+        response = self.request(
             f'{self.config.rclone.rc_addr}/{command}',
-            auth=(self.config.rclone.rc_user, self.config.rclone.rc_pass),
-            data=data
+            session=self.session,
+            data=data,
+            timeout=self.timeout,
+            **kwargs
         )
+        errors = 0 if int(str(response.status_code)[0]) == 2 else 1
+        self.metrics.observe(f'rc:{command}', time.perf_counter() - started, bytes=len(response.content), errors=errors)
+        if self.governor and errors and self.governor.is_throttled(response.status_code, response.text):
+            retry_after = response.headers.get('Retry-After')
+            self.governor.record(throttled=True, retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+            self.metrics.observe('rc_throttled', 0, errors=1)
+        return response
 
     def _command(self, command, url, username=None, password=None):
         '''command: str, url: str, username: str = None, password: str = None -> Response'''
         return self.request(
             f'{url}/{command}',
-            auth=(username if username else '', password if password else '')
+            auth=(username if username else '', password if password else ''),
+            timeout=self.timeout
         )
 
-    def vfs_refresh(self, dirs):
-        '''dirs: list[str] -> Response'''
-        counter = 1
-        data = {}
-        for dir in dirs:
-            #self.logger.debug(f'새로고침 경로: {dir}')
-            data[f'dir{counter}'] = self.get_remote_path(dir)
-            counter += 1
-        return self.command('vfs/refresh', data=data)
+    def plan_refresh(self, remote_dirs, recursive=False):
+        '''remote_dirs: list[str], recursive: bool = False -> dict[str, list[str]]'''
+        '''
+        vfs/refresh 할 경로를 정리해서 {새로고침 경로: [포함되는 요청 경로, ...]} 형태로 반환
+
+        - 경로를 정규화하고 중복 제거
+        - recursive 일 경우 상위 경로에 포함되는 하위 경로는 제외
+        - recursive 일 경우 refresh_merge_siblings 개 이상의 형제 폴더가 부모 폴더의 하위 폴더를
+          refresh_merge_coverage 비율 이상 차지하면 부모 폴더로 병합
+          마운트를 읽으면 리모트 목록 조회가 생기기 때문에 하위 폴더 수는 incremental 새로고침의 폴더 색인으로 확인하고
+          색인에 없는 부모 폴더는 요청한 하위 폴더 수로 판단 (refresh_merge_siblings 개 이상이면 병합)
+        '''
+        plan = {}
+        if not recursive:
+            for dir in remote_dirs:
+                plan.setdefault(PathTrie.join(PathTrie.split(dir)), []).append(dir)
+            return plan
+        index = None
+        def children(parts):
+            nonlocal index
+            index = index or DirectoryIndex(self.get_db_file())
+            return index.count_children(self.namespace, '/' + PathTrie.join(parts).strip('/')) or None
+        trie = PathTrie(remote_dirs)
+        try:
+            planned = set(trie.collapse(
+                self.config.rclone.get('refresh_merge_siblings', 0), children, self.config.rclone.get('refresh_merge_coverage', 0.9)
+            ))
+        finally:
+            if index:
+                index.close()
+        for dir in remote_dirs:
+            parts = PathTrie.split(dir)
+            for depth in range(len(parts) + 1):
+                if parts[:depth] in planned:
+                    plan.setdefault(PathTrie.join(parts[:depth]), []).append(dir)
+                    break
+        return plan
+
+    def vfs_refresh(self, dirs, callback=None, recursive=None, force=False):
+        '''dirs: list[str], callback: Callable[[dict], Any] = None, recursive: bool = None, force: bool = False -> list[dict]'''
+        '''
+        dirs 를 refresh_chunk_size 개씩 나누어 vfs/refresh 요청
+        최대 refresh_concurrency 개(governor 를 사용하면 governor 가 조절)의 요청을 동시에 진행하고 묶음별 결과를 반환
+        callback 이 있으면 묶음이 끝날 때마다 해당 결과로 호출
+        결과의 locals 에는 해당 묶음으로 새로고침되는 로컬 경로가 담겨 있음
+        recursive 가 None 이면 refresh_recursive 설정값을 따름
+        아직 마운트에 보이지 않는 폴더는 보이는 상위 폴더로 새로고침하기 때문에 refresh_ttl 캐시를 사용하지 않음
+        force 가 True 이면 (직접 지정한 폴더) 최근에 새로고침되었어도 다시 새로고침
+        '''
+        remote_locals = {}
+        uncached = set()
+        with self.metrics.phase('path_mapping', dirs=len(dirs)):
+            for dir in dirs:
+                remote = self.get_remote_path(dir)
+                remote_locals.setdefault(remote, []).append(dir)
+                if not self.mapper.is_dir(dir):
+                    uncached.add(remote)
+        return self.refresh_remote(remote_locals, callback, recursive, uncached, force)
+
+    def refresh_remote(self, remote_locals, callback=None, recursive=None, uncached=(), force=False):
+        '''remote_locals: dict[str, list[str]], callback: Callable[[dict], Any] = None, recursive: bool = None, uncached: Collection[str] = (), force: bool = False -> list[dict]'''
+        '''
+        {리모트 경로: [로컬 경로, ...]} 를 vfs/refresh
+        uncached 의 리모트 경로는 refresh_ttl 캐시를 확인하지도 기록하지도 않음
+        (상위 폴더가 최근에 새로고침되었어도 그 뒤에 생긴 하위 폴더는 보이지 않기 때문)
+        force 가 True 이면 캐시를 확인하지 않고 새로고침한 결과만 기록
+        '''
+        if not remote_locals:
+            return []
+        remote_locals = dict(remote_locals)
+        if recursive is None:
+            recursive = self.config.rclone.get('refresh_recursive', False)
+        results = []
+        if self.refresh_cache and not force:
+            fresh = [remote for remote in remote_locals if remote not in uncached and self.refresh_cache.is_fresh(remote, recursive)]
+            if fresh:
+                result = {'endpoint': self.endpoint, 'dirs': fresh, 'jobid': None, 'success': True, 'output': None, 'error': None, 'duration': 0, 'cached': True}
+                result.update(refreshed=fresh, failed={}, attempt=1, retrying=False, failed_locals=[])
+                result['locals'] = [local for remote in fresh for local in remote_locals.pop(remote)]
+                self.metrics.observe('refresh_cached', 0, dirs=len(fresh))
+                results.append(result)
+                if callback:
+                    callback(result)
+            if not remote_locals:
+                return results
+        plan = self.plan_refresh(list(remote_locals.keys()), recursive)
+        planned_dirs = list(plan.keys())
+        if len(planned_dirs) < len(remote_locals):
+            self.logger.debug(f'새로고침 경로 정리: {len(remote_locals)} -> {len(planned_dirs)}')
+        chunk_size = self.config.rclone.get('refresh_chunk_size', 0) or len(planned_dirs)
+        chunks = [planned_dirs[i:i + chunk_size] for i in range(0, len(planned_dirs), chunk_size)]
+        # governor 를 사용하면 동시 요청 수는 governor 가 조절
+        max_concurrency = self.governor.maximum if self.governor else self.config.rclone.get('refresh_concurrency', 4)
+        concurrency = max(1, min(max_concurrency, len(chunks)))
+        retries = self.config.rclone.get('refresh_retries', 3)
+        def locals_of(planned_dirs):
+            return [local for planned in planned_dirs for remote in plan[planned] for local in remote_locals[remote]]
+        import heapq
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        with self.metrics.phase('vfs_refresh', dirs=len(planned_dirs)) as counts, \
+                ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='vfs_refresh') as executor:
+            futures = {executor.submit(self.refresh_chunk, chunk, recursive): 1 for chunk in chunks}
+            # 재시도 대기열: (요청할 시각, 시도 횟수, 폴더 목록)
+            delayed = []
+            while futures or delayed:
+                now = time.monotonic()
+                while delayed and delayed[0][0] <= now:
+                    _, attempt, retry_dirs = heapq.heappop(delayed)
+                    futures[executor.submit(self.refresh_chunk, retry_dirs, recursive)] = attempt
+                timeout = delayed[0][0] - now if delayed else None
+                if not futures:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    attempt = futures.pop(future)
+                    result = future.result()
+                    result['attempt'] = attempt
+                    result['retrying'] = bool(result['failed']) and attempt <= retries
+                    result['locals'] = locals_of(result['refreshed'])
+                    result['failed_locals'] = [] if result['retrying'] else locals_of(result['failed'])
+                    self.metrics.observe('vfs_refresh_chunk', result['duration'], dirs=len(result['dirs']), errors=0 if result['success'] else 1)
+                    if result['retrying']:
+                        result['retry_delay'] = self.retry_delay(attempt)
+                        heapq.heappush(delayed, (time.monotonic() + result['retry_delay'], attempt + 1, list(result['failed'])))
+                        self.metrics.observe('refresh_retry', 0, dirs=len(result['failed']))
+                    elif result['failed']:
+                        counts['errors'] = counts.get('errors', 0) + 1
+                        self.metrics.observe('refresh_failed', 0, dirs=len(result['failed']))
+                    if self.refresh_cache and result['refreshed']:
+                        self.refresh_cache.mark([dir for dir in result['refreshed'] if dir not in uncached], recursive)
+                    results.append(result)
+                    if callback:
+                        callback(result)
+        if self.governor:
+            self.metrics.gauge('rc_concurrency_limit', self.governor.limit)
+            self.logger.info(f'RC 요청 조절 상태: {self.governor.describe()}')
+        return results
+
+    def retry_delay(self, attempt):
+        '''attempt: int -> float'''
+        '''refresh_retry_delay 에서 시작해서 두 배씩 늘어나는 대기 시간의 절반을 무작위로 조정'''
+        import random
+        delay = min(self.config.rclone.get('refresh_retry_max_delay', 30), self.config.rclone.get('refresh_retry_delay', 2) * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def failed_locals(results):
+        '''results: list[dict] -> list[str]'''
+        '''재시도 후에도 새로고침에 실패한 로컬 경로'''
+        return [local for result in results for local in result.get('failed_locals', [])]
+
+    def list_dirs(self, remote_dir):
+        '''remote_dir: str -> dict[str, str] | None'''
+        '''
+        operations/list 로 remote_dir 아래의 모든 항목을 조회해서 {폴더: 상태} 를 반환
+        구글 드라이브 등은 파일이 추가되어도 폴더의 수정 시각이 바뀌지 않기 때문에
+        상태는 폴더의 수정 시각과 바로 아래 파일들의 (이름, 크기, 수정 시각) 을 합친 요약값 (remote_dir 자신도 포함)
+        '''
+        import hashlib
+        remote = PathTrie.join(PathTrie.split(remote_dir)).strip('/')
+        with self.metrics.phase('list_dirs') as counts:
+            with self.governor_slot():
+                response = self.command('operations/list', json={
+                    'fs': self.config.rclone.fs,
+                    'remote': remote,
+                    'opt': {'recurse': True, 'noMimeType': True}
+                })
+            if int(str(response.status_code)[0]) != 2:
+                self.logger.error(f'폴더 목록 조회 실패 [{remote_dir}] CODE: {response.status_code}, 내용: {response.text}')
+                counts['errors'] = 1
+                return None
+            root = f'/{remote}' if remote else '/'
+            modtimes = {root: ''}
+            files = {}
+            for item in response.json().get('list', []):
+                path = item.get('Path', '')
+                if remote and not (path == remote or path.startswith(f'{remote}/')):
+                    path = f'{remote}/{path}'
+                if item.get('IsDir'):
+                    modtimes[f'/{path}'] = item.get('ModTime') or ''
+                else:
+                    files.setdefault(os.path.dirname(f'/{path}'), []).append(f'{item.get("Name")}\0{item.get("Size")}\0{item.get("ModTime")}')
+            dirs = {}
+            for path, modtime in modtimes.items():
+                digest = hashlib.sha1(modtime.encode())
+                for entry in sorted(files.get(path, ())):
+                    digest.update(b'\n' + entry.encode())
+                dirs[path] = digest.hexdigest()
+            counts.update(dirs=len(dirs), items=sum(len(entries) for entries in files.values()), bytes=len(response.content))
+        return dirs
+
+    def refresh_incremental(self, dirs, callback=None):
+        '''dirs: list[str], callback: Callable[[dict], Any] = None -> list[dict]'''
+        '''
+        operations/list 로 조회한 폴더 상태(수정 시각, 바로 아래 파일 목록)를 이전 실행의 색인과 비교해서 변경된 부분만 새로고침
+            - 상태가 바뀐 폴더, 폴더가 생기거나 삭제된 부모 폴더, 기준 폴더: 비 recursive 새로고침 (먼저)
+            - 새로 생긴 폴더: recursive 새로고침 (부모 폴더의 목록이 갱신된 뒤)
+            - 색인이 없거나 목록 조회에 실패한 기준 폴더: 전체를 recursive 새로고침
+        모든 새로고침이 성공해야 색인을 갱신
+        '''
+        index = DirectoryIndex(self.get_db_file())
+        results = []
+        try:
+            for dir in dirs:
+                root = self.get_remote_path(dir)
+                listing = self.list_dirs(root)
+                previous = index.load(self.namespace + root) if listing is not None else {}
+                if not previous:
+                    self.logger.info(f'색인이 없어서 전체를 새로고침: {root}')
+                    root_results = self.refresh_remote({root: [dir]}, callback, recursive=True)
+                else:
+                    new = [path for path in listing if path not in previous]
+                    removed = [path for path in previous if path not in listing]
+                    changed = [path for path in listing if path in previous and listing[path] != previous[path]]
+                    self.logger.info(f'변경된 폴더 [{root}]: 추가 {len(new)}, 삭제 {len(removed)}, 수정 {len(changed)}')
+                    shallow = dict.fromkeys([root] + changed + [os.path.dirname(path) for path in new + removed])
+                    shallow = [path for path in shallow if path not in listing or path in previous]
+                    # 새 폴더는 부모 폴더의 캐시된 목록으로 찾기 때문에 부모 폴더를 먼저 새로고침해야 함
+                    root_results = self.refresh_remote({path: [dir] for path in shallow}, callback, recursive=False)
+                    root_results += self.refresh_remote({path: [dir] for path in new}, callback, recursive=True)
+                results.extend(root_results)
+                if listing is not None and not any(result['failed'] and not result['retrying'] for result in root_results):
+                    index.replace(self.namespace + root, listing)
+        finally:
+            index.close()
+        return results
+
+    def vfs_forget(self, files, callback=None):
+        '''files: dict[str, list[str]], callback: Callable[[dict], Any] = None -> list[dict]'''
+        '''
+        {로컬 폴더: [로컬 파일, ...]} 의 새 파일이 보이도록 vfs/forget 으로 폴더 목록 캐시를 무효화
+        vfs/refresh 처럼 목록을 바로 다시 조회하지 않고 다음에 접근할 때 조회됨
+        다시 조회할 때는 폴더의 전체 항목을 읽기 때문에 비 recursive vfs/refresh 와 조회 비용은 같고 작업 완료를 기다리지 않는 점만 다름
+            - 폴더가 보이면 파일을 지워서 폴더의 목록을 무효화
+            - 폴더가 아직 보이지 않으면 보이는 상위 폴더 바로 아래의 경로를 지워서 상위 폴더의 목록을 무효화
+        파일 수가 forget_max_files 를 넘는 폴더는 요청이 커지지 않도록 비 recursive 로 vfs/refresh
+        vfs/forget 에 실패한 폴더도 vfs/refresh
+        결과 형식은 vfs_refresh 와 같고 vfs/forget 결과에는 forget 이 True
+        '''
+        max_files = self.config.rclone.get('forget_max_files', 10)
+        forget, refresh = {}, []
+        with self.metrics.phase('path_mapping', dirs=len(files)):
+            for folder, folder_files in files.items():
+                existing = self.mapper.find_existing(folder)
+                if not folder_files or len(folder_files) > max_files or existing is None:
+                    refresh.append(folder)
+                elif existing == folder:
+                    forget[folder] = [self.mapper.map(file) for file in folder_files]
+                else:
+                    child = PathTrie.join(PathTrie.split(folder)[:len(PathTrie.split(existing)) + 1])
+                    forget[folder] = [self.mapper.map(child)]
+        def forget_chunk(chunk):
+            paths = list(dict.fromkeys(path for folder in chunk for path in forget[folder]))
+            data = {f'file{index}': path.lstrip('/') for index, path in enumerate(paths, start=1)}
+            remote_dirs = [self.mapper.map(folder) for folder in chunk]
+            result = {'endpoint': self.endpoint, 'dirs': remote_dirs, 'jobid': None, 'success': False, 'output': None, 'error': None, 'forget': True, 'files': len(paths)}
+            started = time.monotonic()
+            with self.governor_slot():
+                response = self.command('vfs/forget', data=data)
+            result['duration'] = time.monotonic() - started
+            if int(str(response.status_code)[0]) == 2:
+                result.update(success=True, output=response.json(), refreshed=remote_dirs, locals=chunk)
+            else:
+                result.update(error=f'CODE: {response.status_code}, 내용: {response.text}', refreshed=[], locals=[], fallback=chunk)
+            result.update(failed={}, attempt=1, retrying=False, failed_locals=[])
+            return result
+        results = []
+        folders = list(forget)
+        chunk_size = self.config.rclone.get('refresh_chunk_size', 0) or len(folders)
+        chunks = [folders[i:i + chunk_size] for i in range(0, len(folders), chunk_size)]
+        if chunks:
+            max_concurrency = self.governor.maximum if self.governor else self.config.rclone.get('refresh_concurrency', 4)
+            from concurrent.futures import ThreadPoolExecutor, as_completed
+            with self.metrics.phase('vfs_forget', dirs=len(folders)) as counts, \
+                    ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks))), thread_name_prefix='vfs_forget') as executor:
+                for future in as_completed([executor.submit(forget_chunk, chunk) for chunk in chunks]):
+                    result = future.result()
+                    if result['success']:
+                        counts['items'] = counts.get('items', 0) + result['files']
+                    else:
+                        counts['errors'] = counts.get('errors', 0) + 1
+                        refresh.extend(result['fallback'])
+                    results.append(result)
+                    if callback:
+                        callback(result)
+        if refresh:
+            results += self.vfs_refresh(refresh, callback, recursive=False)
+        return results
+
+    def log_refresh_result(self, result):
+        '''result: dict -> None'''
+        if result.get('cached'):
+            self.logger.info(f'최근에 새로고침되어 생략 [{len(result["dirs"])}개 폴더]: {result["dirs"]}')
+            return
+        if result.get('unreachable'):
+            self.logger.error(f'리모트에 접속할 수 없어서 새로고침하지 않음 [{result["endpoint"]}, {len(result["dirs"])}개 폴더]: {result["dirs"]}')
+            return
+        if result.get('forget'):
+            if result['success']:
+                self.logger.info(f'캐시 무효화 완료 [{len(result["dirs"])}개 폴더, {result["duration"]:.1f}초]: {result["dirs"]}')
+            else:
+                self.logger.warning(f'캐시 무효화 실패, 새로고침으로 대신함 [{len(result["dirs"])}개 폴더]: {result["error"]}')
+            return
+        summary = f'{len(result["dirs"])}개 폴더, {result["duration"]:.1f}초, jobid: {result["jobid"]}, 시도: {result["attempt"]}'
+        if result.get('endpoint'):
+            summary = f'{result["endpoint"]}, {summary}'
+        if result['success']:
+            self.logger.info(f'새로고침 완료 [{summary}]: {result["output"]}')
+        elif result['retrying']:
+            self.logger.warning(f'새로고침 실패 [{summary}], {len(result["failed"])}개 폴더를 {result["retry_delay"]:.1f}초 후 다시 요청: {result["failed"]}')
+        else:
+            self.logger.error(f'새로고침 실패 [{summary}], {len(result["failed"])}개 폴더: {result["failed"]}')
+
+    def refresh_chunk(self, remote_dirs, recursive=False):
+        '''remote_dirs: list[str], recursive: bool = False -> dict'''
+        '''
+        _async 로 요청하면 실제 작업(드라이브 API 호출)은 rclone 안에서 진행되기 때문에
+        작업이 끝날 때까지 governor 의 자리를 차지하고, 폴더당 소요 시간을 응답 시간으로 반영
+        '''
+        with self.governor_slot():
+            result = self._refresh_chunk(remote_dirs, recursive)
+        self.parse_refresh_result(result)
+        # 요청 자체가 실패한 경우는 command 에서 governor 에 반영됨
+        if self.governor and (result['jobid'] is not None or result['error'] is None):
+            errors = ' '.join([result['error'] or ''] + list(result['failed'].values()))
+            if self.governor.is_throttled(200, errors):
+                # 작업 도중의 사용량 제한 오류는 job/status 의 error 나 폴더별 결과로 전달됨
+                self.governor.record(throttled=True)
+            elif result['error'] is None:
+                # job/status 의 duration 은 확인 간격과 상관없는 실제 작업 시간
+                duration = result.get('job_duration') or result['duration']
+                self.governor.record(latency=duration / max(1, len(remote_dirs)))
+        return result
+
+    def parse_refresh_result(self, result):
+        '''result: dict -> None'''
+        '''
+        vfs/refresh 출력의 폴더별 결과({"result": {폴더: "OK" | 오류 메시지}})를 읽어서
+        refreshed(성공한 폴더 목록), failed({실패한 폴더: 오류 메시지})를 추가
+        요청이나 작업이 실패하면 모든 폴더가 실패, 폴더별 결과가 없으면 모든 폴더가 성공
+        '''
+        if result['error'] is not None or not result['success']:
+            failed = {dir: result['error'] or '알 수 없는 오류' for dir in result['dirs']}
+        else:
+            per_dir = result['output'].get('result') if isinstance(result['output'], dict) else None
+            per_dir = per_dir if isinstance(per_dir, dict) else {}
+            failed = {dir: str(per_dir[dir]) for dir in result['dirs'] if per_dir.get(dir, 'OK') != 'OK'}
+        result['failed'] = failed
+        result['refreshed'] = [dir for dir in result['dirs'] if dir not in failed]
+        result['success'] = not failed
+
+    def _refresh_chunk(self, remote_dirs, recursive=False):
+        '''remote_dirs: list[str], recursive: bool = False -> dict'''
+        data = {f'dir{i}': dir for i, dir in enumerate(remote_dirs, start=1)}
+        if recursive:
+            data['recursive'] = 'true'
+        result = {'endpoint': self.endpoint, 'dirs': remote_dirs, 'jobid': None, 'success': False, 'output': None, 'error': None}
+        started = time.monotonic()
+        if self.config.rclone.get('refresh_async', True):
+            data['_async'] = 'true'
+            response = self.command('vfs/refresh', data=data)
+            if int(str(response.status_code)[0]) == 2:
+                result['jobid'] = response.json().get('jobid')
+                result.update(self.wait_job(result['jobid']))
+            else:
+                result['error'] = f'CODE: {response.status_code}, 내용: {response.text}'
+        else:
+            response = self.command('vfs/refresh', data=data)
+            if int(str(response.status_code)[0]) == 2:
+                result['success'] = True
+                result['output'] = response.json()
+            else:
+                result['error'] = f'CODE: {response.status_code}, 내용: {response.text}'
+        result['duration'] = time.monotonic() - started
+        return result
+
+    def wait_job(self, jobid, max_errors=5):
+        '''jobid: int, max_errors: int = 5 -> dict'''
+        '''
+        job/status 로 작업이 끝날 때까지 확인
+        job/status 요청이 실패하면 max_errors 번 연속으로 실패할 때까지 같은 작업을 계속 확인
+        시간 초과나 연속 실패로 기다리지 않게 되면 다시 요청한 작업과 겹쳐서 실행되지 않도록 job/stop
+        '''
+        interval = self.config.rclone.get('job_poll_interval', 1)
+        deadline = time.monotonic() + self.config.rclone.get('job_timeout', 3600)
+        errors = 0
+        while True:
+            response = self.command('job/status', data={'jobid': jobid})
+            if int(str(response.status_code)[0]) == 2:
+                errors = 0
+                status = response.json()
+                if status.get('finished'):
+                    return {'success': status.get('success', False), 'output': status.get('output'), 'error': status.get('error') or None, 'job_duration': status.get('duration')}
+            else:
+                error = f'CODE: {response.status_code}, 내용: {response.text}'
+                # 끝난 작업은 rclone 에서 일정 시간 후 삭제되므로 더 기다릴 작업이 없음
+                if 'job not found' in response.text:
+                    return {'success': False, 'error': error}
+                errors += 1
+                if errors >= max_errors:
+                    self.stop_job(jobid)
+                    return {'success': False, 'error': error}
+            if time.monotonic() > deadline:
+                self.stop_job(jobid)
+                return {'success': False, 'error': f'작업 대기 시간 초과 (jobid: {jobid})'}
+            time.sleep(interval)
+
+    def stop_job(self, jobid):
+        '''jobid: int -> bool'''
+        response = self.command('job/stop', data={'jobid': jobid})
+        if int(str(response.status_code)[0]) == 2:
+            self.logger.warning(f'기다리지 않는 작업을 중지했어요. (jobid: {jobid})')
+            return True
+        self.logger.warning(f'작업을 중지하지 못했어요. (jobid: {jobid}) CODE: {response.status_code}, 내용: {response.text}')
+        return False
 
     def get_remote_path(self, local_path):
         '''local_path: str -> str'''
-        if os.path.isfile(local_path):
-            local_path = os.path.split(local_path)[0]
-        while not os.path.exists(local_path):
-            if os.path.split(local_path)[1] == '':
-                self.logger.error("마지막 경로까지 확인해 봤지만 존재하지 않는 경로예요.")
-                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), local_path)
-            local_path = os.path.split(local_path)[0]
-        for k, v in self.config.rclone.rc_mapping.items():
-            local_path = os.path.normpath(local_path.replace(k, v))
-        return local_path
+        existing_path = self.mapper.find_existing(local_path)
+        if existing_path is None:
+            self.logger.error("마지막 경로까지 확인해 봤지만 존재하지 않는 경로예요.")
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), local_path)
+        return self.mapper.map(existing_path)
+
+class AgentRcloneRouter(AgentBase):
+
+    '''
+    로컬 경로에 따라 폴더를 여러 rclone RC 로 나누어 보내는 agent
+    rclone.endpoints 의 리모트마다 AgentRclone 을 만들고 rc_mapping 의 찾을 경로 중 가장 길게 일치하는 리모트로 보냄
+    어느 리모트의 규칙에도 맞지 않는 경로는 기본 리모트(rclone.rc_addr)로 보냄
+    리모트별 새로고침은 동시에 진행해서 느린 리모트가 다른 리모트를 기다리게 하지 않음
+    '''
+
+    def __init__(self, config):
+        '''config: dict'''
+        super(AgentRcloneRouter, self).__init__(config, name='agent.rclone.router')
+        endpoints = [None] + list(self.config.rclone.get('endpoints') or {})
+        if len(endpoints) > 1:
+            # 리모트별 접속 확인을 동시에 진행
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=len(endpoints), thread_name_prefix='rc_endpoint') as executor:
+                agents = list(executor.map(lambda endpoint: AgentRclone(config, endpoint), endpoints))
+        else:
+            agents = [AgentRclone(config)]
+        self.agents = dict(zip(endpoints, agents))
+        self.default = self.agents[None]
+        routes = {}
+        for endpoint, agent in self.agents.items():
+            for source in agent.config.rclone.rc_mapping:
+                routes.setdefault(source, endpoint)
+        self.routes = PathMapper(routes)
+
+    @property
+    def connectible(self):
+        '''None -> bool'''
+        return any(agent.connectible for agent in self.agents.values())
+
+    def check_connection(self):
+        '''None -> bool'''
+        for agent in self.agents.values():
+            agent.connectible = agent.check_connection()
+        return self.connectible
+
+    def command(self, command, data=None, **kwargs):
+        '''command: str, data: dict = None, Unpack[Any, Any] -> Response'''
+        '''직접 전송하는 명령은 기본 리모트로'''
+        return self.default.command(command, data=data, **kwargs)
+
+    def log_refresh_result(self, result):
+        '''result: dict -> None'''
+        self.default.log_refresh_result(result)
+
+    def route(self, dirs):
+        '''dirs: list[str] -> dict[str | None, list[str]]'''
+        routed = {}
+        for dir in dirs:
+            matched = self.routes.lookup(dir)
+            routed.setdefault(matched[0] if matched else None, []).append(dir)
+        return routed
+
+    def dispatch(self, dirs, refresh, callback=None):
+        '''dirs: list[str], refresh: Callable[[AgentRclone, list[str], Callable], list[dict]], callback: Callable[[dict], Any] = None -> list[dict]'''
+        '''
+        dirs 를 리모트별로 나누어 refresh(agent, 폴더 목록, callback) 을 동시에 실행
+        접속할 수 없는 리모트의 폴더는 실패한 결과로 반환
+        callback 은 한번에 하나씩 호출
+        '''
+        routed = self.route(dirs)
+        lock = threading.Lock()
+        def locked_callback(result):
+            with lock:
+                callback(result)
+        def run(endpoint, endpoint_dirs):
+            agent = self.agents[endpoint]
+            if not agent.connectible:
+                result = {
+                    'endpoint': endpoint or 'default', 'dirs': endpoint_dirs, 'jobid': None, 'success': False, 'output': None,
+                    'error': '접속 불가', 'duration': 0, 'unreachable': True, 'refreshed': [], 'failed': dict.fromkeys(endpoint_dirs, '접속 불가'),
+                    'attempt': 1, 'retrying': False, 'locals': [], 'failed_locals': list(endpoint_dirs)
+                }
+                if callback:
+                    locked_callback(result)
+                return [result]
+            with self.metrics.phase(f'endpoint:{endpoint or "default"}', dirs=len(endpoint_dirs)) as counts:
+                results = refresh(agent, endpoint_dirs, locked_callback if callback else None)
+                counts['errors'] = sum(1 for result in results if result['failed'] and not result['retrying'])
+            return results
+        if len(routed) == 1:
+            return run(*next(iter(routed.items())))
+        from concurrent.futures import ThreadPoolExecutor
+        results = []
+        with ThreadPoolExecutor(max_workers=len(routed), thread_name_prefix='rc_endpoint') as executor:
+            for endpoint_results in executor.map(lambda item: run(*item), routed.items()):
+                results.extend(endpoint_results)
+        return results
+
+    def vfs_refresh(self, dirs, callback=None, recursive=None, force=False):
+        '''dirs: list[str], callback: Callable[[dict], Any] = None, recursive: bool = None, force: bool = False -> list[dict]'''
+        return self.dispatch(dirs, lambda agent, endpoint_dirs, callback: agent.vfs_refresh(endpoint_dirs, callback, recursive, force), callback)
+
+    def vfs_forget(self, files, callback=None):
+        '''files: dict[str, list[str]], callback: Callable[[dict], Any] = None -> list[dict]'''
+        return self.dispatch(list(files), lambda agent, endpoint_dirs, callback: agent.vfs_forget({dir: files[dir] for dir in endpoint_dirs}, callback), callback)
+
+    def refresh_incremental(self, dirs, callback=None):
+        '''dirs: list[str], callback: Callable[[dict], Any] = None -> list[dict]'''
+        '''rclone.fs 설정이 없는 리모트는 새로고침하지 않음'''
+        def refresh(agent, endpoint_dirs, callback):
+            if not agent.config.rclone.get('fs'):
+                agent.logger.error(f'--incremental 은 rclone.fs 설정이 필요해요. ({agent.endpoint or "default"})')
+                return []
+            return agent.refresh_incremental(endpoint_dirs, callback)
+        return self.dispatch(dirs, refresh, callback)
+
+class TaskGraph:
+
+    '''
+    의존 관계가 있는 작업들을 위상 순서대로 실행
+    의존하는 작업이 모두 끝난 작업들은 동시에 실행
+    '''
+
+    def __init__(self):
+        '''None'''
+        self.tasks = {}
+
+    def add(self, name, func, depends=(), description=None):
+        '''name: str, func: Callable[[], Any], depends: Iterable[str] = (), description: str = None -> None'''
+        self.tasks[name] = {'func': func, 'depends': tuple(depends), 'description': description if description else name}
+
+    def order(self):
+        '''None -> list[str]'''
+        remains = {}
+        for name, task in self.tasks.items():
+            for depend in task['depends']:
+                if depend not in self.tasks:
+                    raise Exception(f'존재하지 않는 작업에 의존: {name} -> {depend}')
+            remains[name] = set(task['depends'])
+        ordered = []
+        while remains:
+            ready = [name for name, depends in remains.items() if not depends]
+            if not ready:
+                raise Exception(f'순환 의존: {list(remains.keys())}')
+            for name in ready:
+                del remains[name]
+                ordered.append(name)
+            for depends in remains.values():
+                depends.difference_update(ready)
+        return ordered
+
+    def run(self, workers=4, callback=None):
+        '''workers: int = 4, callback: Callable[[str, Any, float], Any] = None -> dict[str, tuple[Any, float]]'''
+        '''
+        작업별 (결과, 실행 시간)을 반환, 작업 중 발생한 예외는 결과로 저장
+        앞선 작업이 실패해도 의존하는 작업은 실행됨
+        '''
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        self.order()
+        remains = {name: set(task['depends']) for name, task in self.tasks.items()}
+        results = {}
+
+        def execute(name):
+            started = time.monotonic()
+            try:
+                result = self.tasks[name]['func']()
+            except Exception as e:
+                result = e
+            return result, time.monotonic() - started
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='task') as executor:
+            running = {}
+            while remains or running:
+                for name in [name for name, depends in remains.items() if not depends]:
+                    del remains[name]
+                    running[executor.submit(execute, name)] = name
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    for depends in remains.values():
+                        depends.discard(name)
+                    if callback:
+                        callback(name, *results[name])
+        return results
+
+class ProcessWaiter:
+
+    '''
+    ps 명령 없이 /proc 을 직접 읽어서 프로세스를 찾고 종료를 기다림
+    pidfd 를 지원하면 프로세스가 종료되는 즉시 깨어나고 아니면 interval 간격으로 확인
+    '''
+
+    APT_LOCKS = (
+        '/var/lib/dpkg/lock-frontend',
+        '/var/lib/dpkg/lock',
+        '/var/lib/apt/lists/lock',
+        '/var/cache/apt/archives/lock',
+    )
+
+    def __init__(self, interval=0.05):
+        '''interval: float = 0.05'''
+        self.interval = interval
+
+    def find_pids(self, name, cmdline=False):
+        '''name: str, cmdline: bool = False -> list[int]'''
+        '''
+        이름이 name 과 정확히 일치하는 프로세스의 pid 목록
+        cmdline 이 True 이면 전체 명령어가 name 과 정확히 일치하는 프로세스
+        '''
+        pids = []
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit() or int(entry) == os.getpid():
+                continue
+            try:
+                with open(f'/proc/{entry}/cmdline', 'rb') as stream:
+                    args = stream.read().rstrip(b'\0').decode('utf-8', 'replace').split('\0')
+                if cmdline:
+                    matched = ' '.join(args) == name
+                else:
+                    with open(f'/proc/{entry}/comm', 'r') as stream:
+                        comm = stream.read().strip()
+                    matched = comm == name or os.path.basename(args[0]) == name
+            except OSError:
+                continue
+            if matched:
+                pids.append(int(entry))
+        return pids
+
+    def is_running(self, pid):
+        '''pid: int -> bool'''
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as stream:
+                return stream.read().rsplit(')', 1)[1].split()[0] != 'Z'
+        except (OSError, IndexError):
+            return False
+
+    def wait_pids(self, pids, timeout):
+        '''pids: Iterable[int], timeout: float -> bool'''
+        '''pids 가 모두 종료되면 True, timeout 초 안에 종료되지 않으면 False'''
+        import select
+        deadline = time.monotonic() + timeout
+        remains = set(pids)
+        pidfds = {}
+        if hasattr(os, 'pidfd_open'):
+            for pid in list(remains):
+                try:
+                    pidfds[os.pidfd_open(pid)] = pid
+                except ProcessLookupError:
+                    remains.discard(pid)
+                except OSError:
+                    pass
+        try:
+            poller = select.poll()
+            for fd in pidfds:
+                poller.register(fd, select.POLLIN)
+            while True:
+                remains = {pid for pid in remains if self.is_running(pid)}
+                if not remains:
+                    return True
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                # 모든 프로세스의 pidfd 가 있으면 종료될 때까지 대기, 아니면 interval 마다 확인
+                wait = left if set(pidfds.values()) >= remains else min(left, self.interval)
+                if pidfds:
+                    for fd, _ in poller.poll(wait * 1000):
+                        poller.unregister(fd)
+                else:
+                    time.sleep(wait)
+        finally:
+            for fd in pidfds:
+                os.close(fd)
+
+    def lock_holders(self, paths):
+        '''paths: Iterable[str] -> list[int]'''
+        '''/proc/locks 에서 paths 파일에 잠금을 걸고 있는 프로세스의 pid 목록'''
+        inodes = set()
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            inodes.add((os.major(stat.st_dev), os.minor(stat.st_dev), stat.st_ino))
+        if not inodes:
+            return []
+        pids = set()
+        try:
+            with open('/proc/locks', 'r') as stream:
+                for line in stream:
+                    fields = line.split()
+                    if '->' in fields or len(fields) < 6:
+                        continue
+                    try:
+                        major, minor, inode = fields[5].split(':')
+                        if (int(major, 16), int(minor, 16), int(inode)) in inodes and int(fields[4]) > 0:
+                            pids.add(int(fields[4]))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return list(pids)
+
+    def wait_locks(self, paths, timeout):
+        '''paths: Iterable[str], timeout: float -> bool'''
+        '''paths 파일의 잠금이 모두 풀리면 True'''
+        paths = tuple(paths)
+        deadline = time.monotonic() + timeout
+        while True:
+            holders = self.lock_holders(paths)
+            if not holders:
+                return True
+            if not self.wait_pids(holders, max(0, deadline - time.monotonic())):
+                return False
 
 class AgentInitBase(AgentBase):
 
@@ -237,33 +2068,42 @@ class AgentInitBase(AgentBase):
     def __init__(self, config, name=None):
         '''config: dict, name: str = None'''
         super(AgentInitBase, self).__init__(config, name=name)
-        with open(self.config.ff_config, 'r') as stream:
-            self.config['ff_config'] = yaml.safe_load(stream)
+        yaml_cache = YamlCache(self.get_db_file())
+        try:
+            self.config['ff_config'] = yaml_cache.load(self.config.ff_config)
             self.plugins_dir = f'{self.config.ff_config.path_data}/plugins'
-        self.plugins_indtalled = self.get_installed_plugins()
-
-    def get_installed_plugins(self):
-        '''None -> dict[str, dict]'''
+            self.plugins_indtalled = self.get_installed_plugins(yaml_cache)
+        finally:
+            yaml_cache.close()
+
+    def get_installed_plugins(self, yaml_cache=None):
+        '''yaml_cache: YamlCache = None -> dict[str, dict]'''
+        '''plugins_dir 의 info.yaml 들을 읽음, 이전 실행 이후 바뀌지 않은 파일은 저장된 결과를 사용'''
+        import yaml
+        cache = yaml_cache if yaml_cache else YamlCache(self.get_db_file())
         plugins_indtalled = {}
-        for dir in os.listdir(self.plugins_dir):
-            try:
+        try:
+            for dir in os.listdir(self.plugins_dir):
                 info_file = f'{self.plugins_dir}/{dir}/info.yaml'
-                with open(info_file, "r") as stream:
-                    try:
-                        plugins_indtalled[dir] = yaml.safe_load(stream)
-                    except yaml.YAMLError as ye:
-                        self.logger.error(ye)
-            except FileNotFoundError as fnfe:
-                self.logger.error(f'{fnfe}: {info_file}')
-                continue
+                try:
+                    plugins_indtalled[dir] = cache.load(info_file)
+                except yaml.YAMLError as ye:
+                    self.logger.error(ye)
+                except (FileNotFoundError, NotADirectoryError) as fnfe:
+                    self.logger.error(f'{fnfe}: {info_file}')
+                    continue
+        finally:
+            if not yaml_cache:
+                cache.close()
         return plugins_indtalled
 
     def check_command(self, *args):
         '''args: Unpack[str] -> bool'''
         return True if self.sub_run(*args).returncode == 0 else False
 
-    def sub_run(self, *args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, encoding="utf-8", **kwargs):
+    def sub_run(self, *args, stdout=-1, stderr=-2, encoding="utf-8", **kwargs):
         '''args: Unpack[str], stdout: int = -1, stderr: int = -2, encoding: str = "utf-8", Unpack[Any, Any] -> CompletedProcess'''
+        import subprocess
         if not self.config.init.execute_commands:
             raise Exception(f'설정값에 의해 명령어를 실행할 수 없음 (execute_commands: {self.config.init.execute_commands})')
         try:
@@ -278,87 +2118,125 @@ class AgentInitUbuntu(AgentInitBase):
         '''config: dict'''
         super(AgentInitUbuntu, self).__init__(config, name='agent.init.ubuntu')
 
-    def check_process(self, name, timeout):
-        '''name: str, timeout: int -> bool'''
-        counter = state = 0
-        while state > -1:
-            state = self.sub_run('ps', 'aux', timeout=timeout).stdout.find(name)
-            if counter > timeout:
-                break
-            time.sleep(1)
-            counter += 1
-        return True if state < 0 else False
+    def check_process(self, name, timeout, cmdline=False):
+        '''name: str, timeout: int, cmdline: bool = False -> bool'''
+        '''이름이 name 인 프로세스가 모두 종료되면 True, timeout 초 안에 종료되지 않으면 False'''
+        waiter = ProcessWaiter()
+        return waiter.wait_pids(waiter.find_pids(name, cmdline), timeout)
+
+    def wait_apt(self, timeout):
+        '''timeout: int -> bool'''
+        '''dpkg/apt 잠금 파일을 가진 프로세스가 종료될 때까지 대기'''
+        if not ProcessWaiter().wait_locks(ProcessWaiter.APT_LOCKS, timeout):
+            self.logger.warning(f'apt 잠금이 {timeout}초 안에 풀리지 않았어요.')
+            return False
+        return True
 
     def init(self):
         '''None -> None'''
+        '''
+        설치된 플러그인과 필요한 플러그인을 따라가며 실행할 명령어의 의존 관계를 만들어서 실행
+            1. 설정 파일의 명령어: 순서대로 실행
+            2. 필요한 패키지: apt-get install 한번으로 설치, 실패하면 하나씩 설치
+            3. 플러그인이 필요로 하는 명령어: 패키지 설치 후 순서대로 실행, independent 로 지정한 명령어는 동시에 실행
+            4. 필요한 플러그인 git clone: 설정 파일의 명령어 후 실행
+        의존하는 작업이 끝난 명령어는 최대 init.workers 개까지 동시에 실행
+        '''
         #self.check_process('apt', self.config.get('timeout', 300))
         #print(f'command : {self.check_command("nano", "-V")}')
         #test_plugins = ['sjva', 'klive_plus', 'wv_tool', 'wavve', 'kakaotv', 'cppl', 'bot_downloader', 'gds_tool', 'make_yaml', 'flaskfilemanager', 'terminal', 'ffmpeg', 'number_baseball', 'trans', 'static_host', 'rclone', 'support_site', 'metadata', 'discord_bot', 'libgdrive', 'fp_ktv', 'plex_mate', 'vnStat', 'torrent_info', 'tving_search', 'subtitle_tool', 'fp_movie', 'hotdeal_alarm', 'lotto', 'musicProc2', 'sporki', 'gugutv', 'narrtv', 'cooltv']
+        dependencies = self.config.init.dependencies
 
-        require_plugins = {}
-        require_packages = {}
-        require_commands = {}
-
-        # plugin by plugin
-        for plugin, info in self.plugins_indtalled.items():
-           # append this plugin's requires to
-            depend_plugins = self.config.init.dependencies.get(plugin, {}).get('plugins', [])
-            for depend in depend_plugins:
-                require_plugins[depend] = False
-
+        # plugin by plugin, including the requires of required plugins
+        plugins = list(self.plugins_indtalled.keys())
+        repos = {}
+        for plugin in plugins:
+            requires = list(dependencies.get(plugin, {}).get('plugins', []))
             # update dependencies from info.yaml
-            requires = info.get("require_plugin")
-            if requires:
-                for req in requires:
-                    req = req.split("/")[-1]
-                    require_plugins[req] = False
-
-            # append this plugin's packages to
-            for depend in self.config.init.dependencies.get(plugin, {}).get('packages', []):
-                require_packages[depend] = False
-
-            # append this plugin's commands to
-            for depend in self.config.init.dependencies.get(plugin, {}).get('commands', []):
-                require_commands[depend] = False
-
-        # pop installed plugins
-        for plugin in self.plugins_indtalled.keys():
-            require_plugins.pop(plugin, None)
+            info = self.plugins_indtalled.get(plugin) or {}
+            for req in info.get('require_plugin') or []:
+                repos.setdefault(req.split('/')[-1], req)
+                requires.append(req.split('/')[-1])
+            for req in requires:
+                if req not in plugins:
+                    plugins.append(req)
+
+        require_plugins = [plugin for plugin in plugins if plugin not in self.plugins_indtalled]
+        require_packages = list(dict.fromkeys(
+            package for plugin in plugins for package in dependencies.get(plugin, {}).get('packages', [])
+        ))
+        # 명령어는 문자열이나 {command: 명령어, independent: True} 형식
+        require_commands = {}
+        for plugin in plugins:
+            for command in dependencies.get(plugin, {}).get('commands', []):
+                if isinstance(command, dict):
+                    require_commands.setdefault(command.get('command'), bool(command.get('independent')))
+                else:
+                    require_commands.setdefault(command, False)
+
+        import subprocess
+        graph = TaskGraph()
+        apt_timeout = self.config.init.get('apt_timeout', 1800)
+        def uses_apt(command):
+            # sudo, 환경 변수, && 등으로 이어진 명령어 안의 apt 도 확인
+            return re.search(r'(^|[\s;&|(])(apt|apt-get|dpkg)(\s|$)', command) is not None
+        def run_command(command, timeout):
+            # 다른 apt 프로세스가 끝나는 즉시 시작
+            if uses_apt(command):
+                self.wait_apt(timeout)
+            return self.sub_run("/usr/bin/env", "bash", "-c", command, timeout=timeout)
+        def add_command(name, command, depends):
+            graph.add(name, lambda: run_command(command, self.config.init.timeout), depends, command)
 
-        executable_commands = []
         # 1. Commands from the config file
-        if self.config.init.commands:
-            for command in self.config.init.commands:
-                executable_commands.append(command)
+        prepared = ()
+        for i, command in enumerate(self.config.init.commands or []):
+            add_command(f'commands.{i}', command, prepared)
+            prepared = (f'commands.{i}',)
 
-        # 2. Commands of installing required packages
+        # 2. Command of installing required packages
+        installed = prepared
         if require_packages:
-            for req in require_packages.keys():
-                command = f'apt-get install -y {req}'
-                executable_commands.append(command)
+            def install_packages():
+                # 패키지 설치는 init.timeout 보다 오래 걸릴 수 있어서 apt_timeout 을 사용
+                result = run_command(f'apt-get install -y {" ".join(require_packages)}', apt_timeout)
+                if result.returncode == 0 or len(require_packages) < 2:
+                    return result
+                # 한번에 설치하지 못하면 설치할 수 있는 패키지는 설치되도록 하나씩 설치
+                self.logger.warning(f'패키지를 한번에 설치하지 못해서 하나씩 설치해요: {result.stdout}')
+                failed = [package for package in require_packages if run_command(f'apt-get install -y {package}', apt_timeout).returncode != 0]
+                return subprocess.CompletedProcess(result.args, 1 if failed else 0, stdout=f'설치하지 못한 패키지: {failed}')
+            graph.add('packages', install_packages, prepared, f'apt-get install -y {" ".join(require_packages)}')
+            installed = ('packages',)
 
         # 3. Commands from plugin dependencies of the config file
-        if require_commands:
-            for req in require_commands:
-                executable_commands.append(req)
+        # pip, curl | bash 등은 서로 영향을 줄 수 있어서 순서대로 실행하고 independent 로 지정한 명령어만 동시에 실행
+        previous = installed
+        for i, (command, independent) in enumerate(require_commands.items()):
+            if independent and not uses_apt(command):
+                add_command(f'dependencies.{i}', command, installed)
+            else:
+                add_command(f'dependencies.{i}', command, previous)
+                previous = (f'dependencies.{i}',)
 
         # 4. Commands of installing required plugins
-        if require_plugins:
-            for plugin in require_plugins.keys():
-                command = f'git clone {self.config.init.dependencies.get(plugin, {"repo": "NO INFO."}).get("repo")} {self.plugins_dir}/{plugin}'
-                executable_commands.append(command)
+        for plugin in require_plugins:
+            repo = dependencies.get(plugin, {}).get('repo') or repos.get(plugin, 'NO INFO.')
+            add_command(f'plugins.{plugin}', f'git clone {repo} {self.plugins_dir}/{plugin}', prepared)
 
-        for command in executable_commands:
-            self.logger.info(f'실행 예정 명령어: {command}')
+        for name in graph.order():
+            self.logger.info(f'실행 예정 명령어: {graph.tasks[name]["description"]}')
 
         # run commands
-        for command in executable_commands:
-            result = self.sub_run("/usr/bin/env", "bash", "-c", command, timeout=self.config.init.timeout)
-            if result.returncode == 0:
+        def on_finished(name, result, elapsed):
+            if isinstance(result, subprocess.CompletedProcess) and result.returncode == 0:
                 msg = '성공'
             else:
-                msg = result.stdout
-            self.logger.info(f'실행 결과 [{command}]: {msg}')
+                msg = result.stdout if isinstance(result, subprocess.CompletedProcess) else result
+            self.logger.info(f'실행 결과 [{graph.tasks[name]["description"]}] ({elapsed:.1f}초): {msg}')
+        started = time.monotonic()
+        graph.run(self.config.init.get('workers', 4), callback=on_finished)
+        self.logger.info(f'전체 실행 시간: {time.monotonic() - started:.1f}초')
 
 '''
 Methods
@@ -372,9 +2250,192 @@ def op_plexmate(args, config):
     from framework.init_main import Framework # type: ignore
     F = Framework.get_instance()
     plexmate_agent = AgentPlexmate(config, F)
+    journal = None
+    def open_journal(key, dirs, max_age=None):
+        '''
+        journal 설정을 사용하면 실행 기록을 시작
+        같은 key 의 끝나지 않은 실행이 있으면 이어받아서 새로고침/스캔 등록이 끝난 폴더는 생략
+        '''
+        if not plexmate_agent.config.plexmate.get('journal', True):
+            return None
+        if max_age is None:
+            max_age = plexmate_agent.config.plexmate.get('journal_max_age', 86400)
+        opened = RunJournal(plexmate_agent.get_db_file(), key, max_age)
+        if opened.begin(dirs):
+            plexmate_agent.logger.info(f'끝나지 않은 이전 실행을 이어서 진행 [{key}]: 새로고침이 남은 폴더 {len(opened.pending("refreshed"))}개')
+        return opened
+    def close_journal(finished):
+        if journal:
+            if finished:
+                journal.finish()
+            journal.close()
+    def pending(step, dirs):
+        return journal.pending(step) if journal else dirs
+    def mark_refreshed(result, incremental=False):
+        record(result, incremental)
+        if journal and result['locals']:
+            journal.mark('refreshed', result['locals'])
     def add_scan(dirs):
-        for dir in dirs:
-            plexmate_agent.add_scan(dir)
+        plexmate_agent.add_scans(dirs)
+        if journal:
+            journal.mark('scanned', dirs)
+    def log_failed(failed):
+        if failed:
+            plexmate_agent.logger.error(f'새로고침에 실패해서 스캔하지 않은 폴더 {len(failed)}개: {failed}')
+        return failed
+    def report_failed(results):
+        return log_failed(AgentRclone.failed_locals(results or []))
+    flight = None
+    # 이번 실행에서 새로고침한 폴더: {(incremental, 로컬 폴더): 성공 여부}
+    outcomes = {}
+    outcomes_lock = threading.Lock()
+    def record(result, incremental=False):
+        with outcomes_lock:
+            for dir in result['locals']:
+                outcomes.setdefault((incremental, dir), True)
+            for dir in result['failed_locals']:
+                outcomes[(incremental, dir)] = False
+    server = None
+    server_stop = threading.Event()
+    def is_leader():
+        '''
+        single_flight 설정을 사용하면 잠금을 얻은 실행만 leader
+        leader 는 자신의 작업을 하는 동안에도 다른 실행의 요청을 처리하는 스레드를 시작
+        '''
+        nonlocal flight, server
+        if not plexmate_agent.config.plexmate.get('single_flight', True):
+            return True
+        if flight is None:
+            flight = SingleFlight(plexmate_agent.get_db_file(), plexmate_agent.logger, plexmate_agent.config.plexmate.get('single_flight_timeout', 3600))
+        if not flight.acquire():
+            return False
+        if server is None:
+            def run():
+                rclone_agent = None
+                while not server_stop.wait(flight.poll_interval):
+                    requests = flight.requests()
+                    if requests:
+                        rclone_agent = rclone_agent or AgentRcloneRouter(config)
+                        try:
+                            serve(requests, rclone_agent)
+                        except Exception:
+                            plexmate_agent.logger.error(traceback.format_exc())
+            server_stop.clear()
+            server = threading.Thread(target=run, name='single_flight', daemon=True)
+            server.start()
+        return True
+    def hand_over(dirs, incremental=False, force=False, wait=True):
+        '''
+        진행중인 leader 에게 dirs 의 새로고침을 넘기고 결과 {'failed': [...]} 를 기다림
+        기다리는 동안 leader 가 끝나서 잠금을 얻으면 None 을 반환하고 직접 실행
+        wait 가 False 이면 넘기기만 하고 {'failed': []} 를 반환
+        '''
+        if not dirs:
+            plexmate_agent.logger.info("새로고침 대상이 없어요.")
+            return {'failed': []}
+        if not wait:
+            flight.submit(dirs, incremental, force, reply=False)
+            plexmate_agent.logger.info(f'다른 실행이 진행중이라 폴더 {len(dirs)}개의 새로고침을 넘겼어요.')
+            return {'failed': []}
+        plexmate_agent.logger.info(f'다른 실행이 진행중이라 폴더 {len(dirs)}개의 새로고침을 넘기고 기다려요.')
+        with plexmate_agent.metrics.phase('single_flight_wait', dirs=len(dirs)):
+            handed = flight.wait(flight.submit(dirs, incremental, force))
+        if handed is None:
+            plexmate_agent.logger.info('진행중이던 실행이 끝나서 직접 실행해요.')
+            # 기다리는 동안 잠금을 얻었으므로 leader 로서 요청 처리를 시작
+            is_leader()
+        return handed
+    def serve(requests, rclone_agent):
+        '''
+        쌓인 요청을 모아서 한번에 새로고침하고 요청별로 결과를 전달
+        이번 실행에서 이미 새로고침한 폴더는 다시 요청하지 않음 (refresh 명령이 직접 지정한 폴더는 다시 새로고침)
+        '''
+        for incremental, force in ((False, False), (False, True), (True, False)):
+            with outcomes_lock:
+                dirs = list(dict.fromkeys(
+                    dir for _, request in requests
+                    if bool(request.get('incremental')) == incremental and bool(request.get('force')) == force
+                    for dir in request['dirs'] if force or (incremental, dir) not in outcomes
+                ))
+                for dir in dirs:
+                    outcomes.pop((incremental, dir), None)
+            if not dirs:
+                continue
+            plexmate_agent.logger.info(f'다른 실행이 요청한 폴더 {len(dirs)}개를 새로고침')
+            if not rclone_agent.connectible:
+                rclone_agent.logger.error('리모트에 접속할 수 없어요.')
+            else:
+                def on_refreshed(result, incremental=incremental):
+                    rclone_agent.log_refresh_result(result)
+                    record(result, incremental)
+                if incremental:
+                    rclone_agent.refresh_incremental(dirs, callback=on_refreshed)
+                else:
+                    rclone_agent.vfs_refresh(dirs, callback=on_refreshed, force=force)
+            with outcomes_lock:
+                for dir in dirs:
+                    outcomes.setdefault((incremental, dir), False)
+        plexmate_agent.metrics.observe('single_flight_merged', 0, items=len(requests), dirs=sum(len(request['dirs']) for _, request in requests))
+        for request_id, request in requests:
+            if request.get('reply', True):
+                incremental = bool(request.get('incremental'))
+                with outcomes_lock:
+                    failed = [dir for dir in request['dirs'] if not outcomes.get((incremental, dir))]
+                flight.respond(request_id, {'failed': failed})
+    def stop_serving():
+        nonlocal server
+        if server is not None:
+            server_stop.set()
+            server.join()
+            server = None
+    def lead():
+        '''leader 의 작업이 끝나면 요청 처리 스레드를 멈추고 남은 요청을 잠금을 풀기 전에 모두 처리'''
+        stop_serving()
+        rclone_agent = None
+        while flight and flight.stream:
+            requests = flight.requests()
+            if not requests:
+                break
+            rclone_agent = rclone_agent or AgentRcloneRouter(config)
+            serve(requests, rclone_agent)
+    def release():
+        stop_serving()
+        if flight:
+            flight.release()
+    def refresh_and_scan(dirs):
+        '''
+        vfs/refresh 가 끝난 묶음부터 바로 스캔을 등록
+        새로고침 단계와 스캔 등록 단계는 크기가 제한된 큐로 연결됨
+        새로고침이 확인된 폴더만 스캔하고 실패한 폴더는 다시 요청한 후에도 실패하면 로그로 남김
+        접속할 수 없는 리모트의 폴더는 새로고침 실패로 처리해서 leader 에게 넘긴 경우와 같이 스캔하지 않음
+        '''
+        rclone_agent = AgentRcloneRouter(config)
+        if not dirs:
+            rclone_agent.logger.info("새로고침 대상이 없어요.")
+            return
+        import queue
+        results = queue.Queue(maxsize=plexmate_agent.config.plexmate.get('pipeline_queue_size', 10))
+        def scan_stage():
+            while True:
+                result = results.get()
+                if result is None:
+                    break
+                try:
+                    add_scan(result['locals'])
+                except Exception:
+                    plexmate_agent.logger.error(traceback.format_exc())
+        scanner = threading.Thread(target=scan_stage, name='add_scan')
+        scanner.start()
+        def on_refreshed(result):
+            rclone_agent.log_refresh_result(result)
+            mark_refreshed(result)
+            results.put(result)
+        try:
+            refresh_results = rclone_agent.vfs_refresh(dirs, callback=on_refreshed, force=True)
+        finally:
+            results.put(None)
+            scanner.join()
+        report_failed(refresh_results)
     if args.command == 'scan':
         '''
         ff-aider.py plexmate scan --dirs "/path/to/be/scanned"
@@ -389,9 +2450,36 @@ def op_plexmate(args, config):
         이미 존재하는 폴더를 PLEX_MATE에 스캔 요청하면 파일 체크 주기에 따라서 vfs/refresh가 완료되기 전에 스캔이 실행 됨.
         vfs/refresh가 종료된 후 스캔을 추가할 필요가 있음.
         '''
-        args.command = 'vfs/refresh'
-        op_rclone(args, config)
-        add_scan(args.dirs)
+        handed = None if is_leader() else hand_over(args.dirs, force=True)
+        if handed is not None:
+            failed = set(log_failed(handed['failed']))
+            add_scan([dir for dir in args.dirs if dir not in failed])
+            return
+        import hashlib
+        digest = hashlib.sha1('\n'.join(sorted(set(args.dirs))).encode()).hexdigest()
+        journal = open_journal(f'refresh:{digest}', args.dirs)
+        finished = False
+        try:
+            # 새로고침은 끝났지만 스캔 등록 전에 종료된 폴더
+            dirs = pending('refreshed', args.dirs)
+            unrefreshed = set(dirs)
+            refreshed = [dir for dir in pending('scanned', []) if dir not in unrefreshed]
+            if refreshed:
+                add_scan(refreshed)
+            if plexmate_agent.config.plexmate.get('pipeline', True):
+                refresh_and_scan(dirs)
+            else:
+                args.command = 'vfs/refresh'
+                args.dirs = dirs
+                results = op_rclone(args, config, callback=mark_refreshed)
+                # 모든 리모트에 접속할 수 없으면 결과가 없음
+                failed = set(report_failed(results) if results is not None else log_failed(dirs))
+                add_scan([dir for dir in dirs if dir not in failed])
+            finished = True
+            lead()
+        finally:
+            close_journal(finished)
+            release()
     elif args.command == 'periodic':
         '''
         ff-aider.py plexmate periodic {job id}
@@ -413,9 +2501,105 @@ def op_plexmate(args, config):
                     args.dirs.append(location.get('root_path'))
             else:
                 args.dirs.append(folder)
-            args.command = 'vfs/refresh'
-            op_rclone(args, config)
-            mod.one_execute(args.job_id)
+            handed = None if is_leader() else hand_over(args.dirs, args.incremental)
+            if handed is not None:
+                log_failed(handed['failed'])
+                mod.one_execute(args.job_id)
+                return
+            journal = open_journal(f'periodic:{args.job_id}{":incremental" if args.incremental else ""}', args.dirs)
+            finished = False
+            try:
+                args.dirs = pending('refreshed', args.dirs)
+                if args.incremental:
+                    rclone_agent = AgentRcloneRouter(config)
+                    if not rclone_agent.connectible:
+                        rclone_agent.logger.error('리모트에 접속할 수 없어요.')
+                    else:
+                        # 기준 폴더 하나의 변경된 폴더가 모두 새로고침되어야 기준 폴더를 완료로 기록
+                        def on_refreshed(result):
+                            rclone_agent.log_refresh_result(result)
+                            record(result, True)
+                        for dir in args.dirs:
+                            failed = report_failed(rclone_agent.refresh_incremental([dir], callback=on_refreshed))
+                            if not failed and journal:
+                                journal.mark('refreshed', [dir])
+                else:
+                    args.command = 'vfs/refresh'
+                    report_failed(op_rclone(args, config, callback=mark_refreshed, force=False))
+                mod.one_execute(args.job_id)
+                finished = True
+                lead()
+            finally:
+                close_journal(finished)
+                release()
+    elif args.command == 'watch':
+        '''
+        ff-aider.py plexmate watch [--duration 초] [--stop]
+        종료하지 않고 새로 추가된 READY 항목을 확인해서 vfs/refresh
+            - 마지막으로 처리한 항목의 id 이후의 READY 항목만 조회
+            - 새 항목이 없으면 확인 간격을 max_interval 까지 두 배씩 늘림
+            - maintenance_interval 마다 SCANNING, FINISH_TIMEOVER 항목을 점검
+            - 점검으로 다시 READY 가 된 항목은 id 가 이전 값이라 조회되지 않으므로 따로 새로고침
+            - 새로고침에 실패한 폴더는 retries 번까지 다음 확인 때 다시 새로고침
+        FF 프로세스 안에서 하나만 실행되며 --stop 으로 종료
+        '''
+        stop = get_shared('watch_stop', threading.Event)
+        if args.stop:
+            stop.set()
+            plexmate_agent.logger.info('watch 종료를 요청했어요.')
+            return
+        running = get_shared('watch_running', threading.Lock)
+        if not running.acquire(blocking=False):
+            plexmate_agent.logger.warning('이미 watch 가 실행중이에요.')
+            return
+        stop.clear()
+        try:
+            watch = plexmate_agent.config.plexmate.get('watch', {})
+            min_interval = watch.get('min_interval', 2)
+            max_interval = watch.get('max_interval', 60)
+            maintenance_interval = watch.get('maintenance_interval', 60)
+            batch_size = watch.get('batch_size', 500)
+            retries = watch.get('retries', 5)
+            deadline = time.monotonic() + args.duration if args.duration else None
+            rclone_agent = AgentRcloneRouter(config)
+            last_id = 0
+            # 다시 새로고침할 폴더: 시도한 횟수
+            retry = {}
+            next_maintenance = 0
+            interval = min_interval
+            plexmate_agent.logger.info('watch 시작')
+            while not stop.is_set() and (deadline is None or time.monotonic() < deadline):
+                try:
+                    if time.monotonic() >= next_maintenance:
+                        for target in plexmate_agent.check_maintenance():
+                            retry.setdefault(os.path.dirname(target), 0)
+                        plexmate_agent.metrics.gauge('backlog_items', plexmate_agent.count_scan_items('READY'), status='READY')
+                        plexmate_agent.metrics.export()
+                        next_maintenance = time.monotonic() + maintenance_interval
+                    if rclone_agent.check_connection():
+                        new_last_id, dirs = plexmate_agent.get_new_scan_targets('READY', last_id, batch_size)
+                        if dirs:
+                            plexmate_agent.logger.info(f'새 항목: {len(dirs)}개 폴더 (id: {last_id + 1}~{new_last_id})')
+                        if retry:
+                            plexmate_agent.logger.info(f'다시 새로고침: {len(retry)}개 폴더')
+                            dirs = list(dict.fromkeys(list(retry) + dirs))
+                        if dirs:
+                            failed = AgentRclone.failed_locals(rclone_agent.vfs_refresh(dirs, callback=rclone_agent.log_refresh_result) or [])
+                            attempts = {dir: retry.get(dir, 0) + 1 for dir in failed}
+                            retry = {dir: count for dir, count in attempts.items() if count <= retries}
+                            if len(retry) < len(attempts):
+                                plexmate_agent.logger.error(f'{retries}번 다시 시도해도 새로고침에 실패한 폴더: {[dir for dir in attempts if dir not in retry]}')
+                        last_id = new_last_id
+                        interval = min_interval if dirs else min(interval * 2, max_interval)
+                    else:
+                        interval = max_interval
+                except Exception:
+                    plexmate_agent.logger.error(traceback.format_exc())
+                    interval = max_interval
+                stop.wait(interval)
+        finally:
+            running.release()
+            plexmate_agent.logger.info('watch 종료')
     elif args.command is None:
         '''
         ff-aider.py plexmate
@@ -424,18 +2608,68 @@ def op_plexmate(args, config):
             - 파일 체크 TIMEOVER 항목을 처리
             - READY 상태의 항목을 vfs/refresh
         '''
-        plexmate_agent.check_scanning(plexmate_agent.config.plexmate.max_scan_time)
-        if hasattr(plexmate_agent.config.plexmate, 'timeover_range'):
-            plexmate_agent.check_timeover(plexmate_agent.config.plexmate.timeover_range)
-        args.dirs = list(plexmate_agent.get_scan_targets('READY').keys())
-        args.command = 'vfs/refresh'
-        op_rclone(args, config)
-
-def op_rclone(args, config):
-    '''args: Namespace, config: dict -> None'''
-    rclone_agent = AgentRclone(config)
+        batch_size = plexmate_agent.config.plexmate.get('scan_batch_size', 1000)
+        import itertools
+        if not is_leader():
+            # leader 가 periodic 등 다른 명령이면 스캔 점검을 하지 않으므로 follower 가 직접 점검
+            # 새로고침은 leader 에게 넘기고 결과를 기다리지 않음 (실패한 폴더는 READY 로 남아서 다음 실행에서 다시 요청됨)
+            plexmate_agent.check_maintenance()
+            targets = plexmate_agent.get_scan_targets('READY', batch_size)
+            dirs = list(itertools.islice(targets, batch_size))
+            hand_over(dirs, wait=False)
+            while dirs:
+                dirs = list(itertools.islice(targets, batch_size))
+                if dirs:
+                    hand_over(dirs, wait=False)
+            return
+        plexmate_agent.check_maintenance()
+        forget = plexmate_agent.config.get('rclone', {}).get('invalidate', 'refresh') == 'forget'
+        # 새로고침이 끝난 폴더에 나중에 추가된 READY 항목을 건너뛰지 않도록 짧은 시간 동안만 이어받음
+        journal = open_journal('plexmate', [], plexmate_agent.config.plexmate.get('journal_plexmate_max_age', 600))
+        finished = False
+        try:
+            rclone_agent = AgentRcloneRouter(config)
+            if not rclone_agent.connectible:
+                rclone_agent.logger.error('리모트에 접속할 수 없어요.')
+            else:
+                def on_refreshed(result):
+                    rclone_agent.log_refresh_result(result)
+                    mark_refreshed(result)
+                # READY 폴더를 scan_batch_size 개씩 나눠서 새로고침하기 때문에 항목 수와 상관없이 메모리 사용량이 일정함
+                scan_files = plexmate_agent.get_scan_files('READY', batch_size, keep_files=forget)
+                total = 0
+                while True:
+                    files = dict(itertools.islice(scan_files, batch_size))
+                    if not files:
+                        break
+                    total += len(files)
+                    if journal:
+                        journal.begin(files)
+                    dirs = journal.pending('refreshed', files) if journal else list(files)
+                    if not dirs:
+                        continue
+                    if forget:
+                        report_failed(rclone_agent.vfs_forget({dir: files[dir] for dir in dirs}, callback=on_refreshed))
+                    else:
+                        rclone_agent.vfs_refresh(dirs, callback=on_refreshed, force=False)
+                if not total:
+                    rclone_agent.logger.info("새로고침 대상이 없어요.")
+            finished = True
+            lead()
+        finally:
+            close_journal(finished)
+            release()
+
+def op_rclone(args, config, callback=None, force=True):
+    '''args: Namespace, config: dict, callback: Callable[[dict], Any] = None, force: bool = True -> list[dict] | None'''
+    '''
+    vfs/refresh 명령이면 묶음별 새로고침 결과를 반환
+    callback 이 있으면 묶음이 끝날 때마다 결과를 로그로 남긴 후 호출
+    직접 지정한 폴더는 refresh_ttl 캐시와 상관없이 새로고침하고, 기본/periodic 실행은 force=False 로 캐시를 사용
+    '''
+    rclone_agent = AgentRcloneRouter(config)
     if not rclone_agent.connectible:
-        rclone_agent.logger.error(f'리모트에 접속할 수 없어요.')
+        rclone_agent.logger.error('리모트에 접속할 수 없어요.')
     else:
         if args.command == 'vfs/refresh':
             '''
@@ -445,8 +2679,11 @@ def op_rclone(args, config):
             if not args.dirs:
                 rclone_agent.logger.info("새로고침 대상이 없어요.")
             else:
-                response = rclone_agent.vfs_refresh(args.dirs)
-                rclone_agent.logger.info(response.json())
+                def on_refreshed(result):
+                    rclone_agent.log_refresh_result(result)
+                    if callback:
+                        callback(result)
+                return rclone_agent.vfs_refresh(args.dirs, callback=on_refreshed, force=force)
         elif args.command is not None:
             '''
             ff-aider.py rclone {remote command}
@@ -469,25 +2706,8 @@ def op_test(args, config):
     '''args: Namespace, config: dict -> None'''
     print('test')
 
-def run(config):
-    '''config: dict [str, Any] -> None'''
-    parser = argparse.ArgumentParser(
-        description='Flaskfarm 간단(?) 스크립트',
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter
-    )
-    parser.set_defaults(func=op_default, parser=parser)
-    subparsers = parser.add_subparsers(title='Agents', dest='agent')
-
-    arg_dirs = {
-        'dest': 'dirs',
-        'metavar': '"/path/to/be/refresh"',
-        'action': 'extend',
-        'default': [],
-        'nargs': '+',
-        'type': str,
-        'help': '새로고침할 "로컬" 디렉토리: --dirs "/mnt/gds/A" "/mnt/gds/B"'
-    }
-
+def add_parser_plexmate(subparsers, arg_dirs):
+    '''subparsers: _SubParsersAction, arg_dirs: dict -> None'''
     # for plexmate
     parser_plexmate = subparsers.add_parser(
         'plexmate',
@@ -517,7 +2737,18 @@ def run(config):
         help='주기적 스캔의 작업 ID를 입력하여 vfs/refresh 후 해당 작업을 실행합니다'
     )
     parser_plexmate_periodic.add_argument('job_id', type=int)
+    parser_plexmate_periodic.add_argument('--incremental', action='store_true', help='이전 실행 이후 변경된 폴더만 새로고침합니다')
 
+    # for plexmate watch
+    parser_plexmate_watch = subparsers_plexmate.add_parser(
+        'watch',
+        help='종료하지 않고 새로 추가되는 READY 항목들을 vfs/refresh 합니다'
+    )
+    parser_plexmate_watch.add_argument('--duration', type=int, default=0, help='실행 시간(초), 0 이면 종료 요청 전까지 실행')
+    parser_plexmate_watch.add_argument('--stop', action='store_true', help='실행중인 watch 를 종료합니다')
+
+def add_parser_rclone(subparsers, arg_dirs):
+    '''subparsers: _SubParsersAction, arg_dirs: dict -> None'''
     # for rclone
     parser_rclone = subparsers.add_parser(
         'rclone',
@@ -535,6 +2766,8 @@ def run(config):
     )
     parser_rclone_refresh.add_argument('--dirs', **arg_dirs)
 
+def add_parser_init(subparsers, arg_dirs):
+    '''subparsers: _SubParsersAction, arg_dirs: dict -> None'''
     # for init
     parser_init = subparsers.add_parser(
         'init',
@@ -543,6 +2776,8 @@ def run(config):
     )
     parser_init.set_defaults(func=op_init)
 
+def add_parser_test(subparsers, arg_dirs):
+    '''subparsers: _SubParsersAction, arg_dirs: dict -> None'''
     # for test
     parser_test = subparsers.add_parser(
         'test',
@@ -551,14 +2786,117 @@ def run(config):
     )
     parser_test.set_defaults(func=op_test)
 
+PARSERS = {
+    'plexmate': add_parser_plexmate,
+    'rclone': add_parser_rclone,
+    'init': add_parser_init,
+    'test': add_parser_test,
+}
+
+def run(config):
+    '''config: dict [str, Any] -> None'''
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Flaskfarm 간단(?) 스크립트',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.set_defaults(func=op_default, parser=parser)
+    subparsers = parser.add_subparsers(title='Agents', dest='agent')
+
+    arg_dirs = {
+        'dest': 'dirs',
+        'metavar': '"/path/to/be/refresh"',
+        'action': 'extend',
+        'default': [],
+        'nargs': '+',
+        'type': str,
+        'help': '새로고침할 "로컬" 디렉토리: --dirs "/mnt/gds/A" "/mnt/gds/B"'
+    }
+
+    # 실행할 agent 의 명령어만 만들고, agent 가 없거나 알 수 없으면(도움말 등) 모두 만듦
+    agent = config['args'][0] if config['args'] else None
+    for name, add_parser in PARSERS.items():
+        if agent not in PARSERS or agent == name:
+            add_parser(subparsers, arg_dirs)
+
     # finally
     args = parser.parse_args(config['args'])
     # strip leading/tailing double quote from dir string
     if hasattr(args, 'dirs'):
         for i, dir in enumerate(args.dirs):
             args.dirs[i] = dir.strip('"')
+    config['metrics'].command = ' '.join(str(name) for name in (args.agent, getattr(args, 'command', None)) if name)
+    config['timer']['dispatched'] = time.perf_counter()
     args.func(args, config)
 
+'''
+Config
+'''
+
+def validate_config(config):
+    '''config: Any -> None'''
+    if not isinstance(config, dict) or not config:
+        raise Exception('설정 정보가 없어요.')
+    if not isinstance(config.get('log'), dict):
+        raise Exception('log 설정이 없어요.')
+    for section in ('rclone', 'plexmate', 'init', 'metrics'):
+        if section in config and not isinstance(config[section], dict):
+            raise Exception(f'{section} 설정 형식이 올바르지 않아요.')
+    if 'rclone' in config:
+        if not config['rclone'].get('rc_addr'):
+            raise Exception('rclone.rc_addr 설정이 없어요.')
+        config['rclone']['rc_addr'] = config['rclone']['rc_addr'].rstrip('/')
+        config['rclone']['rc_mapping'] = config['rclone'].get('rc_mapping') or {}
+        endpoints = config['rclone'].get('endpoints') or {}
+        if not isinstance(endpoints, dict):
+            raise Exception('rclone.endpoints 설정 형식이 올바르지 않아요.')
+        for name, endpoint in endpoints.items():
+            if not isinstance(endpoint, dict) or not endpoint.get('rc_addr'):
+                raise Exception(f'rclone.endpoints.{name}.rc_addr 설정이 없어요.')
+            endpoint['rc_addr'] = endpoint['rc_addr'].rstrip('/')
+            endpoint['rc_mapping'] = endpoint.get('rc_mapping') or {}
+        config['rclone']['endpoints'] = endpoints
+    if 'timeover_range' in config.get('plexmate', {}):
+        if not re.fullmatch(r'\s*\d+\s*~\s*\d+\s*', str(config['plexmate']['timeover_range'])):
+            raise Exception(f'plexmate.timeover_range 설정 형식이 올바르지 않아요: {config["plexmate"]["timeover_range"]} (예: 1~100)')
+
+def load_config(config_file):
+    '''config_file: str -> dict'''
+    '''
+    ff_aider.yaml 을 읽고 검사한 결과를 {config_file}.cache 에 저장
+    yaml 파일과 ff_aider.py 의 수정 시각과 크기가 같으면 yaml 을 다시 읽지 않고 저장된 결과를 사용
+    (ff_aider.py 가 바뀌면 검사 규칙과 기본값이 달라질 수 있기 때문에 다시 검사)
+    같은 프로세스에서 다시 실행되면(LOAD) 캐시 파일도 읽지 않고 메모리에 저장된 결과를 사용
+    '''
+    import pickle
+    stat = os.stat(config_file)
+    script = os.stat(os.path.abspath(__file__))
+    key = (stat.st_mtime_ns, stat.st_size, script.st_mtime_ns, script.st_size)
+    cache_file = f'{config_file}.cache'
+    configs = get_shared('configs', dict)
+    cached = configs.get(config_file)
+    if cached is None or cached[0] != key:
+        try:
+            with open(cache_file, 'rb') as stream:
+                cached = pickle.load(stream)
+        except Exception:
+            cached = None
+    if cached is not None and cached[0] == key:
+        configs[config_file] = cached
+        return pickle.loads(cached[1])
+    with open(config_file, 'r') as stream:
+        config = yaml_load(stream)
+    validate_config(config)
+    cached = (key, pickle.dumps(config))
+    configs[config_file] = cached
+    try:
+        with open(f'{cache_file}.{os.getpid()}', 'wb') as stream:
+            pickle.dump(cached, stream)
+        os.replace(f'{cache_file}.{os.getpid()}', cache_file)
+    except OSError as e:
+        logging.getLogger(__name__).warning(f'설정 캐시를 저장할 수 없어요: {e}')
+    return config
+
 '''
 Execution
 '''
@@ -570,16 +2908,22 @@ def main(*args, **kwargs):
     :param *args: 실행 방식과 파일명 ex ['LOAD', '/data/commands/test.py', *args]
     :param **kwargs: 로거가 포함되어 있음 {'logger': <Logger command_x (LOGLEVEL)>}
     '''
+    started = time.perf_counter()
     config_file = f'{os.path.dirname(os.path.abspath(__file__))}/ff_aider.yaml'
-    config = None
-    with open(config_file, "r") as stream:
-        config = yaml.safe_load(stream)
-    if config is None:
-        raise Exception('설정 정보가 없어요.')
+    config = load_config(config_file)
+    config['config_file'] = config_file
+    config['timer'] = {'started': started, 'configured': time.perf_counter()}
     if 'logger' in kwargs:
         config['log']['logger'] = kwargs['logger']
     else:
         config['log']['logger'] = None
+    metrics_config = config.get('metrics') or {}
+    config['metrics'] = Metrics(
+        logger=config['log']['logger'],
+        textfile_dir=metrics_config.get('textfile_dir'),
+        log=metrics_config.get('log', True)
+    )
+    config['metrics'].observe('config', config['timer']['configured'] - started)
 
     if args:
         args = list(args)
@@ -590,14 +2934,26 @@ def main(*args, **kwargs):
 
     config['args'] = args
 
+    success = True
     try:
         run(config)
     except Exception as e:
+        success = False
         print(traceback.format_exc())
         if config['log']['logger']:
             config['log']['logger'].error(traceback.format_exc())
-
+    config['metrics'].report(success)
+
+    timer = config['timer']
+    timer['finished'] = time.perf_counter()
+    get_shared('last_timer', dict).update(timer)
+    logger = config['log']['logger'] or logging.getLogger(__name__)
+    logger.debug(
+        f'실행 시간 - 설정: {(timer["configured"] - timer["started"]) * 1000:.1f}ms, '
+        f'준비: {(timer.get("dispatched", timer["finished"]) - timer["started"]) * 1000:.1f}ms, '
+        f'전체: {(timer["finished"] - timer["started"]) * 1000:.1f}ms'
+    )
     print('스크립트 완료, 로그를 확인해 주세요.')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
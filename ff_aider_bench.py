@@ -0,0 +1,724 @@
+#!/usr/bin/env python3
+
+'''
+ff_aider 성능 측정 스크립트
+
+Flaskfarm 이나 rclone 없이 로컬에서 실행합니다.
+
+python3 ff_aider_bench.py plugins --count 300
+python3 ff_aider_bench.py startup --budget-ms 50
+python3 ff_aider_bench.py refresh --sizes 10 1000 50000 --save baseline.json
+python3 ff_aider_bench.py refresh --compare baseline.json
+'''
+
+import sys, os, argparse, tempfile, time, logging, statistics, shutil, subprocess, json
+import types, threading, random, operator, contextlib, urllib.parse
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ff_aider
+
+INFO_YAML = '''title: "플러그인 {index}"
+package_name: plugin_{index}
+version: '1.0.{index}'
+developer: developer_{index}
+description: 벤치마크용 플러그인 {index}
+home: https://github.com/example/plugin_{index}
+category: tool
+require_plugin:
+  - https://github.com/soju6jan/sjva
+  - https://github.com/flaskfarm/support_site
+require_os:
+  - linux
+  - windows
+menu:
+  uri: plugin_{index}
+  name: 플러그인 {index}
+  list:
+{menus}
+'''
+
+MENU_YAML = '''    - uri: menu_{index}
+      name: 메뉴 {index}
+      list:
+        - {{uri: setting, name: 설정}}
+        - {{uri: list, name: 목록}}
+'''
+
+def measure(func, repeat):
+    '''func: Callable[[], Any], repeat: int -> list[float]'''
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+def report(name, timings):
+    '''name: str, timings: list[float] -> None'''
+    print(f'{name:<12} median {statistics.median(timings) * 1000:9.1f} ms   min {min(timings) * 1000:9.1f} ms')
+
+def bench_plugins(args):
+    '''args: Namespace -> None'''
+    '''
+    플러그인 info.yaml 읽기
+        baseline: 이전 방식 (파이썬 yaml.safe_load 로 매번 모두 읽기)
+        cold: 저장된 결과가 없는 상태에서 AgentInitBase 생성
+        warm: 저장된 결과가 있는 상태에서 AgentInitBase 생성
+    '''
+    with tempfile.TemporaryDirectory() as base:
+        plugins_dir = f'{base}/data/plugins'
+        for index in range(args.count):
+            os.makedirs(f'{plugins_dir}/plugin_{index}')
+            with open(f'{plugins_dir}/plugin_{index}/info.yaml', 'w') as stream:
+                stream.write(INFO_YAML.format(index=index, menus=''.join(MENU_YAML.format(index=i) for i in range(5))))
+        ff_config = f'{base}/config.yaml'
+        with open(ff_config, 'w') as stream:
+            yaml.safe_dump({'path_data': f'{base}/data', 'port': 9999, 'plugins': {f'plugin_{i}': {'enable': True} for i in range(args.count)}}, stream)
+        config = {
+            'config_file': f'{base}/ff_aider.yaml',
+            'ff_config': ff_config,
+            'log': {'level': 'WARNING', 'logger': logging.getLogger('ff_aider_bench')},
+        }
+        db_file = f'{base}/ff_aider.db'
+
+        def baseline():
+            with open(ff_config, 'r') as stream:
+                yaml.safe_load(stream)
+            plugins = {}
+            for dir in os.listdir(plugins_dir):
+                with open(f'{plugins_dir}/{dir}/info.yaml', 'r') as stream:
+                    plugins[dir] = yaml.safe_load(stream)
+            return plugins
+
+        def cold():
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(f'{db_file}{suffix}'):
+                    os.remove(f'{db_file}{suffix}')
+            return ff_aider.AgentInitBase(config)
+
+        def warm():
+            return ff_aider.AgentInitBase(config)
+
+        expected = baseline()
+        if cold().plugins_indtalled != expected or warm().plugins_indtalled != expected:
+            raise Exception('읽은 결과가 이전 방식과 달라요.')
+        print(f'플러그인 {args.count}개, libyaml: {yaml.__with_libyaml__}')
+        report('baseline', measure(baseline, args.repeat))
+        report('cold', measure(cold, args.repeat))
+        report('warm', measure(warm, args.repeat))
+
+STARTUP_CODE = '''
+import sys, time, json
+started = time.perf_counter()
+sys.path.insert(0, {base!r})
+import ff_aider
+imported = time.perf_counter()
+sys.argv = [ff_aider.__file__, *{args!r}]
+ff_aider.main()
+timer = ff_aider.get_shared('last_timer', dict)
+print(json.dumps({{
+    'import': imported - started,
+    'config': timer['configured'] - timer['started'],
+    'ready': timer.get('dispatched', timer['finished']) - timer['started'],
+    'total': timer['finished'] - timer['started'],
+}}))
+'''
+
+def bench_startup(args):
+    '''args: Namespace -> None'''
+    '''
+    ff_aider 의 실행 준비 시간
+        import: ff_aider 모듈 import 시간
+        ready: main() 시작부터 명령 실행 직전까지 (설정 읽기, 명령어 해석)
+    첫 실행(설정 캐시 없음) 이후 반복 실행의 import + ready 중앙값이 budget-ms 를 넘거나
+    lazy 로 읽어야 하는 모듈이 import 되면 종료 코드 1
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as base:
+        shutil.copy(f'{here}/ff_aider.py', base)
+        shutil.copy(f'{here}/ff_aider.sample.yaml', f'{base}/ff_aider.yaml')
+        code = STARTUP_CODE.format(base=base, args=args.args)
+        # 반복 실행에서 .pyc 를 재사용하도록
+        env = {key: value for key, value in os.environ.items() if key != 'PYTHONDONTWRITEBYTECODE'}
+        runs = []
+        for _ in range(args.repeat + 1):
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, encoding='utf-8', env=env)
+            if process.returncode != 0:
+                raise Exception(process.stderr)
+            imports = {}
+            for line in process.stderr.splitlines():
+                if line.startswith('import time:') and '|' in line:
+                    _, cumulative_us, name = line.split('|')
+                    if cumulative_us.strip().isdigit():
+                        # 하위 import 는 들여쓰기 됨
+                        imports[name.strip()] = (int(cumulative_us) / 1000, not name[1:].startswith(' '))
+            runs.append((json.loads(process.stdout.strip().splitlines()[-1]), imports))
+    cold, warm = runs[0], runs[1:]
+    print(f'명령: {" ".join(args.args)}')
+    for name, (timing, _) in [('cold', cold)] + [(f'warm {i}', run) for i, run in enumerate(warm, start=1)]:
+        print(f'{name:<8} import {timing["import"] * 1000:7.1f} ms   config {timing["config"] * 1000:7.1f} ms   ready {timing["ready"] * 1000:7.1f} ms   total {timing["total"] * 1000:7.1f} ms')
+    print('import 시간이 긴 모듈 (warm, 누적):')
+    top_level = [(name, elapsed) for name, (elapsed, top) in warm[-1][1].items() if top]
+    for name, elapsed in sorted(top_level, key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'    {elapsed:7.1f} ms  {name}')
+    startup = statistics.median((timing['import'] + timing['ready']) * 1000 for timing, _ in warm)
+    eager = sorted(set(args.lazy) & set(name for _, imports in warm for name in imports))
+    print(f'준비 시간 중앙값: {startup:.1f} ms (예산 {args.budget_ms} ms)')
+    if eager:
+        print(f'필요하지 않은 모듈을 import 했어요: {eager}')
+    if startup > args.budget_ms or eager:
+        print('예산 초과')
+        sys.exit(1)
+
+'''
+Fake rclone RC
+'''
+
+class FakeRclone(ThreadingHTTPServer):
+    '''
+    rclone rcd 대신 사용하는 로컬 HTTP 서버
+    core/version, vfs/refresh (동기, _async), vfs/forget, job/status, job/stop, options/get, operations/list 를 흉내냄
+
+    latency: 모든 요청의 응답 지연(초)
+    job_latency: _async 작업이 끝날 때까지 걸리는 시간(초)
+    fail_rate: vfs/refresh 요청이 HTTP 500 으로 실패할 확률
+    dir_fail_rate: vfs/refresh 결과에서 폴더 하나가 실패로 표시될 확률
+    quota: 동시에 진행할 수 있는 vfs/refresh 작업 수, 넘으면 드라이브처럼 403 userRateLimitExceeded (0: 제한 없음)
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, job_latency=0.0, fail_rate=0.0, dir_fail_rate=0.0, seed=0, quota=0):
+        '''latency: float = 0.0, job_latency: float = 0.0, fail_rate: float = 0.0, dir_fail_rate: float = 0.0, seed: int = 0, quota: int = 0'''
+        super(FakeRclone, self).__init__(('127.0.0.1', 0), FakeRclone.Handler)
+        self.latency = latency
+        self.job_latency = job_latency
+        self.fail_rate = fail_rate
+        self.dir_fail_rate = dir_fail_rate
+        self.quota = quota
+        self.running = 0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.calls = {}
+        self.listing = []
+
+    @property
+    def url(self):
+        '''None -> str'''
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def start(self):
+        '''None -> FakeRclone'''
+        threading.Thread(target=self.serve_forever, name='fake_rclone', daemon=True).start()
+        return self
+
+    def stop(self):
+        '''None -> None'''
+        self.shutdown()
+        self.server_close()
+
+    def chance(self, rate):
+        '''rate: float -> bool'''
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def handle_command(self, command, data):
+        '''command: str, data: dict -> tuple[int, dict]'''
+        with self.lock:
+            self.calls[command] = self.calls.get(command, 0) + 1
+        if command == 'core/version':
+            return 200, {'version': 'v1.66.0-fake', 'os': 'linux', 'arch': 'amd64'}
+        if command == 'options/get':
+            return 200, {'vfs': {'DirCacheTime': 300000000000, 'PollInterval': 60000000000}}
+        if command == 'operations/list':
+            return 200, {'list': self.listing}
+        if command == 'vfs/refresh':
+            if self.chance(self.fail_rate):
+                return 500, {'error': 'fake failure', 'status': 500}
+            now = time.monotonic()
+            with self.lock:
+                running = self.running + sum(1 for finish, _ in self.jobs.values() if finish > now)
+                self.calls['throttled'] = self.calls.get('throttled', 0) + (1 if self.quota and running >= self.quota else 0)
+            if self.quota and running >= self.quota:
+                return 403, {'error': 'googleapi: Error 403: User Rate Limit Exceeded, userRateLimitExceeded', 'status': 403}
+            dirs = [value for key, value in data.items() if key.startswith('dir')]
+            output = {'result': {dir: ('file does not exist' if self.chance(self.dir_fail_rate) else 'OK') for dir in dirs}}
+            if str(data.get('_async')).lower() != 'true':
+                with self.lock:
+                    self.running += 1
+                time.sleep(self.job_latency)
+                with self.lock:
+                    self.running -= 1
+                return 200, output
+            with self.lock:
+                jobid = len(self.jobs) + 1
+                self.jobs[jobid] = (now + self.job_latency, output)
+            return 200, {'jobid': jobid}
+        if command == 'vfs/forget':
+            return 200, {'forgotten': [value for key, value in data.items() if key.startswith(('file', 'dir'))]}
+        if command == 'job/status':
+            with self.lock:
+                job = self.jobs.get(int(data.get('jobid', 0)))
+            if job is None:
+                return 500, {'error': 'job not found', 'status': 500}
+            finished = time.monotonic() >= job[0]
+            return 200, {'finished': finished, 'success': True, 'output': job[1] if finished else {}, 'error': '', 'duration': self.job_latency if finished else 0}
+        if command == 'job/stop':
+            jobid = int(data.get('jobid', 0))
+            with self.lock:
+                if jobid not in self.jobs:
+                    return 500, {'error': 'job not found', 'status': 500}
+                self.jobs[jobid] = (time.monotonic(), {})
+            return 200, {}
+        return 404, {'error': f'couldn\'t find method "{command}"', 'status': 404}
+
+    class Handler(BaseHTTPRequestHandler):
+
+        # requests.Session 의 연결 재사용을 위해 keep-alive
+        # 헤더와 본문을 따로 보내기 때문에 Nagle 알고리즘을 끄지 않으면 응답마다 지연(delayed ACK)이 생김
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length).decode('utf-8')
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                data = json.loads(body or '{}')
+            else:
+                data = {key: values[-1] for key, values in urllib.parse.parse_qs(body).items()}
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            status, output = self.server.handle_command(self.path.strip('/'), data)
+            content = json.dumps(output).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+'''
+Fake plex_mate
+'''
+
+class FakeColumn:
+    '''클래스에서 접근하면 SQLAlchemy 컬럼처럼 조건식을 만들고, 객체에서 접근하면 값을 반환'''
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__.get(self.name)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+
+    def compare(self, op, other):
+        '''op: Callable[[Any, Any], bool], other: Any -> Callable[[Any], bool]'''
+        return lambda item: getattr(item, self.name) is not None and op(getattr(item, self.name), other)
+
+    def __eq__(self, other):
+        return self.compare(operator.eq, other)
+
+    def __ne__(self, other):
+        return self.compare(operator.ne, other)
+
+    def __lt__(self, other):
+        return self.compare(operator.lt, other)
+
+    def __le__(self, other):
+        return self.compare(operator.le, other)
+
+    def __gt__(self, other):
+        return self.compare(operator.gt, other)
+
+    def __ge__(self, other):
+        return self.compare(operator.ge, other)
+
+    __hash__ = object.__hash__
+
+    def in_(self, values):
+        '''values: Iterable[Any] -> Callable[[Any], bool]'''
+        values = set(values)
+        return lambda item: getattr(item, self.name) in values
+
+class FakeScanStore:
+    '''메모리에 저장되는 plex_mate 스캔 목록'''
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.items = {}
+        self.last_id = 0
+        store = self
+
+        class ModelScanItem:
+            id = FakeColumn()
+            target = FakeColumn()
+            status = FakeColumn()
+            process_start_time = FakeColumn()
+            created_time = FakeColumn()
+
+            def __init__(self, target):
+                self.id = None
+                self.target = target
+                self.status = 'READY'
+                self.process_start_time = None
+                self.created_time = datetime.now()
+
+            def save(self):
+                store.save(self)
+
+            def set_status(self, status, save=True):
+                self.status = status
+                if save:
+                    self.save()
+
+            @classmethod
+            def get_list_by_status(cls, status):
+                with store.lock:
+                    return [item for item in store.items.values() if item.status == status]
+
+        self.model = ModelScanItem
+
+    def save(self, item):
+        '''item: ModelScanItem -> None'''
+        with self.lock:
+            if item.id is None:
+                self.last_id += 1
+                item.id = self.last_id
+            else:
+                self.last_id = max(self.last_id, item.id)
+            self.items[item.id] = item
+
+    def fill(self, targets, status='READY'):
+        '''targets: Iterable[str], status: str = 'READY' -> None'''
+        for target in targets:
+            item = self.model(target)
+            item.status = status
+            self.save(item)
+
+class FakeQuery:
+
+    def __init__(self, store, entities, predicates=(), orders=(), size=None):
+        '''store: FakeScanStore, entities: tuple, predicates: tuple = (), orders: tuple = (), size: int = None'''
+        self.store = store
+        self.entities = entities
+        self.predicates = predicates
+        self.orders = orders
+        self.size = size
+
+    def copy(self, **kwargs):
+        values = dict(predicates=self.predicates, orders=self.orders, size=self.size)
+        values.update(kwargs)
+        return FakeQuery(self.store, self.entities, **values)
+
+    def filter(self, *predicates):
+        return self.copy(predicates=self.predicates + predicates)
+
+    def order_by(self, *columns):
+        return self.copy(orders=self.orders + columns)
+
+    def limit(self, size):
+        return self.copy(size=size)
+
+    def yield_per(self, size):
+        return self
+
+    def matches(self):
+        with self.store.lock:
+            items = [item for item in self.store.items.values() if all(predicate(item) for predicate in self.predicates)]
+        for column in reversed(self.orders):
+            items.sort(key=lambda item: getattr(item, column.name))
+        return items[:self.size] if self.size is not None else items
+
+    def all(self):
+        items = self.matches()
+        if len(self.entities) == 1 and self.entities[0] is self.store.model:
+            return items
+        return [tuple(getattr(item, column.name) for column in self.entities) for item in items]
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def first(self):
+        rows = self.limit(1).all()
+        return rows[0] if rows else None
+
+    def count(self):
+        return len(self.matches())
+
+    def delete(self, synchronize_session=None):
+        items = self.matches()
+        with self.store.lock:
+            for item in items:
+                self.store.items.pop(item.id, None)
+        return len(items)
+
+class FakeSession:
+
+    def __init__(self, store):
+        '''store: FakeScanStore'''
+        self.store = store
+        self.local = threading.local()
+
+    @property
+    def pending(self):
+        if not hasattr(self.local, 'pending'):
+            self.local.pending = []
+        return self.local.pending
+
+    def query(self, *entities):
+        return FakeQuery(self.store, entities)
+
+    def add(self, item):
+        self.pending.append(item)
+
+    def add_all(self, items):
+        self.pending.extend(items)
+
+    def flush(self):
+        for item in self.pending:
+            self.store.save(item)
+        self.pending.clear()
+
+    def commit(self):
+        self.flush()
+
+    def rollback(self):
+        self.pending.clear()
+
+def fake_framework(store, sections=None, jobs=None):
+    '''store: FakeScanStore, sections: dict[int, list[str]] = None, jobs: list[dict] = None -> SimpleNamespace'''
+    '''
+    op_plexmate 가 사용하는 Framework 객체
+    get_module('scan'), get_module('periodic'), PlexDBHandle.section_location 만 구현
+    '''
+    sections = sections or {}
+    executed = []
+    scan = types.SimpleNamespace(web_list_model=store.model)
+    periodic = types.SimpleNamespace(get_jobs=lambda: jobs or [], one_execute=executed.append, executed=executed)
+    modules = {'scan': scan, 'periodic': periodic}
+    plugin = types.SimpleNamespace(
+        logic=types.SimpleNamespace(get_module=modules.get),
+        PlexDBHandle=types.SimpleNamespace(section_location=lambda library_id: [{'root_path': path} for path in sections.get(library_id, [])])
+    )
+
+    @contextlib.contextmanager
+    def app_context():
+        yield
+
+    return types.SimpleNamespace(
+        app=types.SimpleNamespace(app_context=app_context),
+        db=types.SimpleNamespace(session=FakeSession(store)),
+        PluginManager=types.SimpleNamespace(get_plugin_instance=lambda name: plugin),
+    )
+
+def install_framework(framework):
+    '''framework: SimpleNamespace -> None'''
+    '''from framework.init_main import Framework 가 framework 를 반환하도록 등록'''
+    package = types.ModuleType('framework')
+    init_main = types.ModuleType('framework.init_main')
+    init_main.Framework = types.SimpleNamespace(get_instance=lambda: framework)
+    package.init_main = init_main
+    sys.modules['framework'] = package
+    sys.modules['framework.init_main'] = init_main
+
+'''
+Refresh benchmark
+'''
+
+class SampleMetrics(ff_aider.Metrics):
+    '''단계별 소요 시간을 모두 보관해서 백분위수를 계산'''
+
+    def __init__(self, *args, **kwargs):
+        super(SampleMetrics, self).__init__(*args, **kwargs)
+        self.samples = {}
+
+    def observe(self, name, seconds, **counts):
+        super(SampleMetrics, self).observe(name, seconds, **counts)
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+def percentile(values, percent):
+    '''values: list[float], percent: float -> float'''
+    '''nearest-rank 백분위수'''
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, -(-len(ordered) * percent // 100) - 1))]
+
+SCENARIOS = ('rclone', 'plexmate', 'plexmate-default')
+
+def bench_refresh(args):
+    '''args: Namespace -> None'''
+    '''
+    로컬 RC 서버와 메모리 plex_mate 로 op_rclone, op_plexmate 를 실행
+        rclone: rclone vfs/refresh --dirs ...
+        plexmate: plexmate refresh --dirs ... (새로고침 후 스캔 등록)
+        plexmate-default: plexmate (READY 항목 점검 후 새로고침)
+    폴더 수별로 처리량(폴더/초)과 묶음 단위 vfs/refresh, RC 요청의 p50/p99 를 출력
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(f'{here}/ff_aider.sample.yaml', 'r') as stream:
+        sample = yaml.safe_load(stream)
+    logger = logging.getLogger('ff_aider_bench')
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+    logger.setLevel(args.log_level)
+    server = FakeRclone(args.latency / 1000, args.job_latency / 1000, args.fail_rate, args.dir_fail_rate, args.seed, args.quota).start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as base:
+            mount = f'{base}/mnt/gds'
+            print(f'RC 지연 {args.latency} ms, 작업 지연 {args.job_latency} ms, 실패율 {args.fail_rate}, 폴더 실패율 {args.dir_fail_rate}, 동시 작업 제한 {args.quota or "없음"}')
+            print(f'{"scenario":<17}{"dirs":>7}{"runs":>6}{"median s":>10}{"dirs/s":>10}{"chunk p50":>11}{"chunk p99":>11}{"rc p50":>9}{"rc p99":>9}{"retried":>9}{"failed":>8}')
+            for size in args.sizes:
+                dirs = [f'{mount}/VOD/{index // 1000:03d}/{index:06d}' for index in range(size)]
+                for dir in dirs:
+                    os.makedirs(dir, exist_ok=True)
+                for scenario in args.scenarios:
+                    timings, metrics_runs = [], []
+                    for _ in range(args.repeat):
+                        config = {key: value for key, value in sample.items() if key != 'init'}
+                        config['rclone'] = dict(sample['rclone'])
+                        config['plexmate'] = dict(sample['plexmate'])
+                        config['rclone'].update({
+                            'rc_addr': server.url,
+                            'rc_mapping': {mount: ''},
+                            'refresh_ttl': 0,
+                            'job_poll_interval': args.poll_interval,
+                            'refresh_retry_delay': args.retry_delay,
+                            'governor': dict(sample['rclone'].get('governor', {}), enabled=not args.no_governor),
+                            'invalidate': args.invalidate,
+                        })
+                        for key in ('refresh_chunk_size', 'refresh_concurrency'):
+                            if getattr(args, key) is not None:
+                                config['rclone'][key] = getattr(args, key)
+                        config['config_file'] = f'{base}/ff_aider.yaml'
+                        config['log'] = {'level': args.log_level, 'logger': logger}
+                        config['metrics'] = SampleMetrics(command=scenario, logger=logger, log=False)
+                        store = FakeScanStore()
+                        install_framework(fake_framework(store))
+                        if scenario == 'rclone':
+                            agent, namespace = ff_aider.op_rclone, argparse.Namespace(agent='rclone', command='vfs/refresh', dirs=list(dirs))
+                        elif scenario == 'plexmate':
+                            agent, namespace = ff_aider.op_plexmate, argparse.Namespace(agent='plexmate', command='refresh', dirs=list(dirs))
+                        else:
+                            store.fill(f'{dir}/file.mkv' for dir in dirs)
+                            agent, namespace = ff_aider.op_plexmate, argparse.Namespace(agent='plexmate', command=None, dirs=[])
+                        started = time.perf_counter()
+                        agent(namespace, config)
+                        timings.append(time.perf_counter() - started)
+                        metrics_runs.append(config['metrics'])
+                        failed = config['metrics'].phases.get('refresh_failed', {}).get('dirs', 0)
+                        if scenario == 'plexmate' and len(store.items) != size - failed:
+                            raise Exception(f'스캔 등록 수가 달라요: {len(store.items)} != {size - failed}')
+                    def samples(name):
+                        return [value for metrics in metrics_runs for value in metrics.samples.get(name, [])]
+                    chunks = samples('vfs_refresh_chunk')
+                    requests = samples('rc:vfs/refresh') + samples('rc:job/status') + samples('rc:vfs/forget')
+                    retried = sum(metrics.phases.get('refresh_retry', {}).get('dirs', 0) for metrics in metrics_runs)
+                    failed = sum(metrics.phases.get('refresh_failed', {}).get('dirs', 0) for metrics in metrics_runs)
+                    median = statistics.median(timings)
+                    result = {
+                        'scenario': scenario,
+                        'dirs': size,
+                        'runs': len(timings),
+                        'median': median,
+                        'throughput': size / median if median else 0.0,
+                        'chunk_p50': percentile(chunks, 50),
+                        'chunk_p99': percentile(chunks, 99),
+                        'rc_p50': percentile(requests, 50),
+                        'rc_p99': percentile(requests, 99),
+                        'retried': retried,
+                        'failed': failed,
+                    }
+                    results.append(result)
+                    print(
+                        f'{scenario:<17}{size:>7}{len(timings):>6}{median:>10.3f}{result["throughput"]:>10.0f}'
+                        f'{result["chunk_p50"] * 1000:>9.1f}ms{result["chunk_p99"] * 1000:>9.1f}ms'
+                        f'{result["rc_p50"] * 1000:>7.1f}ms{result["rc_p99"] * 1000:>7.1f}ms{retried:>9}{failed:>8}'
+                    )
+    finally:
+        server.stop()
+    print(f'RC 요청 수: {dict(sorted(server.calls.items()))}')
+    if args.save:
+        with open(args.save, 'w') as stream:
+            json.dump(results, stream, indent=2)
+        print(f'결과 저장: {args.save}')
+    if args.compare:
+        with open(args.compare, 'r') as stream:
+            baseline = {(result['scenario'], result['dirs']): result for result in json.load(stream)}
+        regressions = []
+        for result in results:
+            previous = baseline.get((result['scenario'], result['dirs']))
+            if previous is None:
+                continue
+            if result['throughput'] < previous['throughput'] * (1 - args.tolerance):
+                regressions.append(f'{result["scenario"]} {result["dirs"]}: 처리량 {previous["throughput"]:.0f} -> {result["throughput"]:.0f} 폴더/초')
+            if result['chunk_p99'] > previous['chunk_p99'] * (1 + args.tolerance):
+                regressions.append(f'{result["scenario"]} {result["dirs"]}: chunk p99 {previous["chunk_p99"] * 1000:.1f} -> {result["chunk_p99"] * 1000:.1f} ms')
+        if regressions:
+            print(f'성능 저하 (허용 범위 {args.tolerance:.0%}):')
+            for regression in regressions:
+                print(f'    {regression}')
+            sys.exit(1)
+        print(f'성능 저하 없음 (허용 범위 {args.tolerance:.0%})')
+
+def run(argv):
+    '''argv: list[str] -> None'''
+    parser = argparse.ArgumentParser(
+        description='ff_aider 성능 측정',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    subparsers = parser.add_subparsers(title='Benchmarks', dest='bench', required=True)
+
+    parser_plugins = subparsers.add_parser('plugins', help='플러그인 info.yaml 읽기 시간을 측정합니다')
+    parser_plugins.add_argument('--count', type=int, default=300, help='만들 플러그인 수')
+    parser_plugins.add_argument('--repeat', type=int, default=5, help='반복 횟수')
+    parser_plugins.set_defaults(func=bench_plugins)
+
+    parser_startup = subparsers.add_parser('startup', help='ff_aider 실행 준비 시간을 측정하고 예산을 넘으면 실패합니다')
+    parser_startup.add_argument('--args', nargs='+', default=['test'], help='ff_aider 에 전달할 명령')
+    parser_startup.add_argument('--repeat', type=int, default=5, help='반복 횟수')
+    parser_startup.add_argument('--budget-ms', type=float, default=50, help='import + 준비 시간 예산(ms)')
+    parser_startup.add_argument('--lazy', nargs='*', default=['requests', 'yaml', 'sqlite3', 'concurrent.futures'], help='import 되면 안 되는 모듈')
+    parser_startup.add_argument('--top', type=int, default=10, help='출력할 모듈 수')
+    parser_startup.set_defaults(func=bench_startup)
+
+    parser_refresh = subparsers.add_parser('refresh', help='로컬 RC 서버와 메모리 plex_mate 로 op_rclone, op_plexmate 를 측정합니다')
+    parser_refresh.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 50000], help='새로고침할 폴더 수')
+    parser_refresh.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS), help='실행할 시나리오')
+    parser_refresh.add_argument('--repeat', type=int, default=3, help='반복 횟수')
+    parser_refresh.add_argument('--latency', type=float, default=1, help='RC 응답 지연(ms)')
+    parser_refresh.add_argument('--job-latency', type=float, default=5, help='vfs/refresh 작업 시간(ms)')
+    parser_refresh.add_argument('--fail-rate', type=float, default=0, help='vfs/refresh 요청 실패 확률')
+    parser_refresh.add_argument('--dir-fail-rate', type=float, default=0, help='vfs/refresh 결과에서 폴더가 실패할 확률')
+    parser_refresh.add_argument('--seed', type=int, default=0, help='실패 주입 난수 시드')
+    parser_refresh.add_argument('--quota', type=int, default=0, help='동시에 진행할 수 있는 vfs/refresh 작업 수 (0: 제한 없음)')
+    parser_refresh.add_argument('--no-governor', action='store_true', help='RC 동시 요청 자동 조절을 끕니다')
+    parser_refresh.add_argument('--invalidate', choices=('refresh', 'forget'), default='refresh', help='plexmate-default 에서 READY 항목의 폴더를 갱신하는 방식 (rclone.invalidate)')
+    parser_refresh.add_argument('--poll-interval', type=float, default=0.005, help='job/status 확인 간격(초)')
+    parser_refresh.add_argument('--retry-delay', type=float, default=0.05, help='refresh_retry_delay(초)')
+    parser_refresh.add_argument('--chunk-size', dest='refresh_chunk_size', type=int, default=None, help='refresh_chunk_size (기본: sample yaml)')
+    parser_refresh.add_argument('--concurrency', dest='refresh_concurrency', type=int, default=None, help='refresh_concurrency (기본: sample yaml)')
+    parser_refresh.add_argument('--log-level', default='WARNING', help='ff_aider 로그 레벨')
+    parser_refresh.add_argument('--save', help='결과를 저장할 JSON 파일')
+    parser_refresh.add_argument('--compare', help='비교할 이전 결과 JSON 파일')
+    parser_refresh.add_argument('--tolerance', type=float, default=0.2, help='허용하는 성능 저하 비율')
+    parser_refresh.set_defaults(func=bench_refresh)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    run(sys.argv[1:])